@@ -0,0 +1,76 @@
+import time
+import numpy as np
+import pandas as pd
+
+from baxter_reader_250116 import assign_metadata_sessions
+
+def make_synthetic_tables(n_machines, n_sessions, events_per_sess=50, samples_per_event=10, seed=0):
+    """
+    장비별로 세션이 이어지는 가상의 merged_event / merged_metadata 생성
+    """
+    rng = np.random.default_rng(seed)
+    events = []
+    metadata = []
+    sess_num = 1
+    for m in range(n_machines):
+        machine = f"PA{m:06d}"
+        t = pd.Timestamp("2024-01-01")
+        for _ in range(n_sessions):
+            # 세션 사이 공백 (세션에 속하지 않는 이벤트 포함)
+            t += pd.Timedelta(minutes=int(rng.integers(10, 120)))
+            times = t + pd.to_timedelta(np.arange(events_per_sess), unit='min')
+            events.append(pd.DataFrame({'Time': times, 'Machine': machine, 'Sess': sess_num}))
+            gap = times[-1] + pd.Timedelta(minutes=5)
+            events.append(pd.DataFrame({'Time': [gap], 'Machine': machine, 'Sess': 0}))
+            sess_num += 1
+
+            sample_times = t + pd.to_timedelta(
+                np.arange(-events_per_sess, events_per_sess * 2) * 60 // samples_per_event, unit='s')
+            metadata.append(pd.DataFrame({'Time': sample_times, 'Machine': machine}))
+            t = gap
+
+    merged_event = pd.concat(events, ignore_index=True)
+    merged_metadata = pd.concat(metadata, ignore_index=True)
+    merged_metadata = merged_metadata.sort_values(['Machine', 'Time']).reset_index(drop=True)
+    return merged_event, merged_metadata
+
+def assign_metadata_sessions_loop(merged_metadata, merged_event):
+    """
+    기존 세션별 mask 반복 방식 (비교용)
+    """
+    merged_metadata['Sess'] = 0
+    for sess in merged_event['Sess'].unique():
+        if sess == 0:
+            continue
+        curr_hd = merged_event[merged_event['Sess'] == sess]
+        t_start = curr_hd['Time'].iloc[0]
+        t_end = curr_hd['Time'].iloc[-1]
+        name_machine = curr_hd['Machine'].iloc[0]
+        mask = ((merged_metadata['Time'] >= t_start) &
+               (merged_metadata['Time'] <= t_end) &
+               (merged_metadata['Machine'] == name_machine))
+        merged_metadata.loc[mask, 'Sess'] = sess
+
+def benchmark_metadata_sessions(sizes=((2, 25), (4, 50), (8, 100), (12, 150))):
+    print(f"{'machines':>8} {'sessions':>8} {'rows':>10} {'loop (s)':>10} {'join (s)':>10} {'speedup':>8}")
+    for n_machines, n_sessions in sizes:
+        merged_event, merged_metadata = make_synthetic_tables(n_machines, n_sessions)
+        meta_loop = merged_metadata.copy()
+        meta_join = merged_metadata.copy()
+
+        start = time.perf_counter()
+        assign_metadata_sessions_loop(meta_loop, merged_event)
+        t_loop = time.perf_counter() - start
+
+        start = time.perf_counter()
+        assign_metadata_sessions(meta_join, merged_event)
+        t_join = time.perf_counter() - start
+
+        if not (meta_loop['Sess'].to_numpy() == meta_join['Sess'].to_numpy()).all():
+            print(f"Mismatch for {n_machines} machines x {n_sessions} sessions")
+
+        print(f"{n_machines:>8} {n_machines * n_sessions:>8} {len(merged_metadata):>10,} "
+              f"{t_loop:>10.3f} {t_join:>10.3f} {t_loop / t_join:>7.1f}x")
+
+if __name__ == "__main__":
+    benchmark_metadata_sessions()
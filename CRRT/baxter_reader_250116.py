@@ -1,9 +1,18 @@
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import csv
 import glob
+import hashlib
+import io
+import json
 import tarfile
 import matplotlib.pyplot as plt
 import os
+import shutil
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 def find_lox_directories(root_path):
@@ -48,10 +57,40 @@ extmap = {
     "pll": ("PLL", ["ascii", "split", "strip", "csv", ])
 }
 
-def get_loxfile_data(fname):
+# csv 섹션의 헤더 행 위치, as_tables=True이면 이 섹션들은 DataFrame으로 바로 읽음
+lox_table_headers = {
+    "User events": 26,
+    "Pressure": 6,
+    "Fluids": 6,
+}
+
+def read_lox_table(f, encoding, header_row):
+    """
+    Reads a csv-like lox member straight from its byte stream into a DataFrame
+    :param f: file object of the tar member
+    :param encoding: text encoding of the member
+    :param header_row: line number of the header row
+    :return: DataFrame with string columns
+    """
+    # tar 스트림은 seek를 지원하지 않으므로 압축 해제된 바이트만 버퍼에 담아 바로 파싱
+    # 헤더보다 필드가 많은 행의 남는 필드는 index_col=False로 버림 (ParserWarning 무시)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.ParserWarning)
+        table = pd.read_csv(io.BytesIO(f.read()), sep=';', encoding=encoding, skiprows=header_row,
+                            header=0, dtype=str, keep_default_na=False, index_col=False,
+                            quoting=csv.QUOTE_NONE)
+    # 기존 split/strip 처리와 같이 행 끝 공백 제거, 헤더 끝 ';'로 생긴 빈 컬럼명은 기존과 같이 ''
+    table.columns = ['' if str(col).startswith('Unnamed: ') else str(col).strip() for col in table.columns]
+    table[table.columns[-1]] = table[table.columns[-1]].str.strip()
+    return table
+
+def get_loxfile_data(fname, sections=None, as_tables=False):
     """
     Returns all the data contained in the loxfile
     :param fname: path to the lox file
+    :param sections: section descriptions to extract (e.g. {"User events", "Fluids"}),
+                     None이면 extmap의 모든 섹션. 요청되지 않은 멤버는 읽지도 디코딩하지도 않음
+    :param as_tables: lox_table_headers의 섹션을 문자열 list 대신 DataFrame으로 반환
     :return: dictionary containing the extracted data
     """
     ret = {}
@@ -64,65 +103,68 @@ def get_loxfile_data(fname):
         print(f"Empty file: {fname}")
         return ret
 
-    try:
-        tar = tarfile.open(fname, "r:gz")
-        try:
-            members = tar.getnames()
-        except Exception as e:
-            print(f"Error reading members from {fname}: {str(e)}")
-            tar.close()
-            return ret
+    # 요청된 섹션만 남길 확장자 목록
+    wanted = {ext for ext, spec in extmap.items()
+              if spec is not None and (sections is None or spec[0] in sections)}
 
-        for member in members:
-            try:
+    try:
+        # 스트림 모드로 멤버를 순서대로 읽고, 필요한 섹션을 모두 찾으면 중단
+        with tarfile.open(fname, "r|gz") as tar:
+            for tarinfo in tar:
+                member = tarinfo.name
                 try:
-                    _ign, ext = map(str.lower, member.split("."))
-                except ValueError:
-                    print(f"Invalid filename format in {fname}: {member}")
-                    continue
-
-                if ext not in extmap:
-                    continue
-
-                if extmap[ext] is None:
-                    continue
+                    try:
+                        _ign, ext = map(str.lower, member.split("."))
+                    except ValueError:
+                        print(f"Invalid filename format in {fname}: {member}")
+                        continue
 
-                try:
-                    f = tar.extractfile(member)
-                    if f is None:
-                        print(f"Could not extract {member} from {fname}")
+                    if ext not in wanted:
                         continue
-                    
-                    desc, extra = extmap[ext]
-                    data = f.read()
-
-                    for elem in extra:
-                        try:
-                            if elem == "strip":
-                                data = [x.strip() for x in data]
-                            elif elem in ["utf-8", "utf-16", "ascii"]:
-                                data = data.decode(elem)
-                            elif elem == "split":
-                                data = data.split("\n")
-                            elif elem == "csv":
-                                data = [x.split(';') for x in data]
-                            elif elem == "noemptylines":
-                                data = [x for x in data if x]
-                        except Exception as e:
-                            print(f"Error processing {elem} for {member} in {fname}: {str(e)}")
+
+                    try:
+                        f = tar.extractfile(tarinfo)
+                        if f is None:
+                            print(f"Could not extract {member} from {fname}")
                             continue
 
-                    ret[desc] = data
+                        desc, extra = extmap[ext]
+
+                        if as_tables and desc in lox_table_headers:
+                            data = read_lox_table(f, extra[0], lox_table_headers[desc])
+                        else:
+                            data = f.read()
+
+                            for elem in extra:
+                                try:
+                                    if elem == "strip":
+                                        data = [x.strip() for x in data]
+                                    elif elem in ["utf-8", "utf-16", "ascii"]:
+                                        data = data.decode(elem)
+                                    elif elem == "split":
+                                        data = data.split("\n")
+                                    elif elem == "csv":
+                                        data = [x.split(';') for x in data]
+                                    elif elem == "noemptylines":
+                                        data = [x for x in data if x]
+                                except Exception as e:
+                                    print(f"Error processing {elem} for {member} in {fname}: {str(e)}")
+                                    continue
+
+                        ret[desc] = data
+                        wanted.discard(ext)
+
+                    except Exception as e:
+                        print(f"Error processing {member} in {fname}: {str(e)}")
+                        continue
 
                 except Exception as e:
-                    print(f"Error processing {member} in {fname}: {str(e)}")
+                    print(f"Unexpected error processing member in {fname}: {str(e)}")
                     continue
 
-            except Exception as e:
-                print(f"Unexpected error processing member in {fname}: {str(e)}")
-                continue
+                if not wanted:
+                    break
 
-        tar.close()
         return ret
 
     except tarfile.ReadError as e:
@@ -132,286 +174,795 @@ def get_loxfile_data(fname):
         print(f"Unexpected error with file {fname}: {str(e)}")
         return ret
 
+def iter_loxfile_data(file_list, num_workers=1, sections=None, as_tables=False):
+    """
+    Yields (file path, get_loxfile_data result) in the order of file_list
+    :param file_list: paths to the lox files
+    :param num_workers: number of decoding processes, 1이면 순차 처리
+    :param sections: section descriptions passed to get_loxfile_data
+    :param as_tables: passed to get_loxfile_data
+    """
+    if num_workers <= 1 or len(file_list) <= 1:
+        for fname in file_list:
+            yield fname, get_loxfile_data(fname, sections, as_tables)
+        return
+
+    # 결과는 파일 순서대로 반환하고, 메모리 사용량 제한을 위해 대기 작업 수를 제한
+    max_pending = num_workers * 2
+    files = iter(file_list)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for fname in files:
+            pending.append((fname, executor.submit(get_loxfile_data, fname, sections, as_tables)))
+            if len(pending) >= max_pending:
+                break
+
+        while pending:
+            fname, future = pending.popleft()
+            try:
+                data = future.result()
+            except Exception as e:
+                print(f"Error decoding {fname} in worker: {str(e)}")
+                data = {}
+
+            next_fname = next(files, None)
+            if next_fname is not None:
+                pending.append((next_fname, executor.submit(get_loxfile_data, next_fname, sections, as_tables)))
+
+            yield fname, data
+
 # 기본 경로 설정
 root_path = "E:\\CRRT\\Baxter"
 base_save_path = os.path.join(root_path, "merge")
+parquet_save_path = os.path.join(root_path, "parquet")
+
+# 출력 형식: 'csv', 'parquet' (Machine/Year로 파티션된 데이터셋), 'both'
+output_format = 'csv'
+
+# Incremental 모드: manifest에 기록된 파일 중 변경되지 않은 파일은 다시 디코딩하지 않고
+# 파일별 캐시를 사용하며, 변경된 (Machine, 연도) 그룹만 다시 저장. 세션 번호는 manifest에 고정
+# merged_*_all.csv는 변경된 그룹이 있을 때만 전체를 다시 쓰고, 통계는 manifest의 그룹별 값을 사용
+incremental = False
+manifest_path = os.path.join(root_path, "baxter_manifest.json")
+cache_path = os.path.join(root_path, "cache")
+
+# LOX 디코딩 프로세스 수 (1이면 순차 처리)
+num_workers = os.cpu_count() or 1
+
+# merged_*_all.csv 병합 시 메모리에 유지할 최대 크기 (MB)
+# None이면 모든 그룹을 메모리에 모았다가 한 번에 저장하고, 지정하면 초과할 때마다 임시 파일에 쓴 뒤
+# 마지막에 컬럼 합집합 헤더로 이어 붙임
+memory_limit_mb = None
+
+# 파이프라인에서 사용하는 LOX 섹션 (나머지 멤버는 디코딩하지 않음)
+lox_sections = {"User events", "Fluids", "Pressure"}
+
+# User events 매핑 테이블: (Type(cod), Type, 컬럼명), 컬럼 순서대로 wide 테이블 생성
+event_code_map = [
+    ('416', '환자 인식 번호:', 'PT_ID'),
+    ('550', '요법 종류:', 'CRRT_type'),
+    ('17', '혈액', 'BFR'),
+    ('22', '사전 혈액 펌프', 'Pre'),
+    ('20', '대체용액', 'Replace'),
+    ('21', '투석액', 'Dialysate'),
+    ('24', '환자 수분 제거', 'UF'),
+    ('16', '치료가 시작되었습니다(실행 모드).', 'HD_start'),
+    ('20', '재시작을 선택했습니다.', 'HD_restart'),
+    ('279', '보고: 필터 응고가 진행중', 'Warning_coag'),
+    ('5', '경고: 필터 응고됨', 'Filter_coag'),
+    ('19', '중지를 선택했습니다.', 'HD_suspend'),
+    ('21', '치료 종료를 선택했습니다.', 'HD_end'),
+]
+
+def build_event_table(dict_file, t_file, machine_name):
+    """
+    User events를 Time 기준 wide 테이블(event_code_map 컬럼)로 변환
+    :param dict_file: get_loxfile_data(..., as_tables=True) 결과
+    :return: DataFrame, 변환할 수 없으면 None
+    """
+    table_event = dict_file['User events'].iloc[:,1:]
+    table_event = table_event[table_event['Time'].astype(str).str.strip() != '']
+    table_event['Time'] = table_event['Time'].astype(str).str[:-2] + '00'
 
-# 만약 merge 폴더가 없다면 생성
-if not os.path.exists(base_save_path):
-    os.makedirs(base_save_path)
-
-# 최종 병합을 위한 DataFrame 초기화
-final_events = None
-final_metadata = None
-current_sess = 1  # 전체 세션 번호 추적용
-
-# .LOX 파일이 있는 모든 디렉토리 찾기
-base_paths = find_lox_directories(root_path)
-
-print("Found directories containing .LOX files:")
-for path in base_paths:
-    path_count = len(glob.glob(os.path.join(path, '*.LOX')))
-    print(f"{path}: {path_count} files")
-
-# 전체 파일 리스트 생성
-list_file = []
-for path in base_paths:
-    path_files = glob.glob(os.path.join(path, '*.LOX'))
-    list_file.extend(path_files)
-
-print(f"\nTotal number of files found: {len(list_file)}")
-
-# 파일들을 폴더별로 그룹화
-grouped_files = group_files_by_folder(list_file)
-
-list_type = ['416', '550', '17', '22', '20', '21', '24', '16', '20', '279', '5', '19', '21']
-list_type_t = ['환자 인식 번호:', '요법 종류:', '혈액', '사전 혈액 펌프', '대체용액', '투석액',
-               '환자 수분 제거', '치료가 시작되었습니다(실행 모드).', '재시작을 선택했습니다.',
-               '보고: 필터 응고가 진행중', '경고: 필터 응고됨', '중지를 선택했습니다.', '치료 종료를 선택했습니다.']
-list_type_cod = ['PT_ID','CRRT_type','BFR','Pre','Replace','Dialysate','UF',
-                 'HD_start','HD_restart', 'Warning_coag', 'Filter_coag','HD_suspend','HD_end']
-
-# 각 그룹별로 처리
-for (folder_name, year), files in grouped_files.items():
-    print(f"\nProcessing {folder_name} {year}...")
-    list_file_group = files
-    
-    # Event 데이터 처리
-    merged_event = None
-    for n, t_file in enumerate(list_file_group):
-        print(f"Processing file {n+1}/{len(list_file_group)}: {t_file}")
-        
-        machine_name = t_file.split('\\')[-3]
-        dict_file = get_loxfile_data(t_file)
+    try:
+        table_event['Time'] = pd.to_datetime(table_event['Time'])
+    except Exception as e:
+        print(f"Error converting time in {t_file}: {str(e)}")
+        return None
 
-        if not dict_file or 'User events' not in dict_file:
-            print(f"Skipping file {t_file} - No valid user events data")
+    table_event.sort_values(by='Time', inplace=True)
+    table_event.reset_index(drop=True, inplace=True)
+
+    # 매핑 테이블과 한 번에 join 후 pivot
+    codes = pd.DataFrame(event_code_map, columns=['Type(cod)', 'Type', 'Column'])
+    col_sub = table_event[['Time', 'Type(cod)', 'Type', 'Sample']].merge(
+        codes, on=['Type(cod)', 'Type'], how='inner')
+    if col_sub.empty:
+        return None
+
+    col_sub['Sample'] = np.where(col_sub['Sample'].astype(str) == '', 'O', col_sub['Sample'])
+
+    # 같은 분에 같은 항목이 여러 번 기록된 경우 순번으로 구분
+    col_sub['Seq'] = col_sub.groupby(['Time', 'Column']).cumcount()
+    all_col = col_sub.pivot(index=['Time', 'Seq'], columns='Column', values='Sample')
+    all_col = all_col.reindex(columns=[code[2] for code in event_code_map])
+    all_col = all_col.reset_index().drop(columns='Seq')
+    all_col.columns.name = None
+
+    all_col.sort_values(by='Time', inplace=True)
+    all_col['Machine'] = machine_name
+
+    return all_col
+
+def build_metadata_table(dict_file, machine_name):
+    """
+    Fluids와 Pressure를 Time 기준으로 병합
+    :param dict_file: get_loxfile_data(..., as_tables=True) 결과
+    :return: DataFrame, 두 테이블 중 하나라도 없으면 None
+    """
+    if 'Fluids' not in dict_file or 'Pressure' not in dict_file:
+        return None
+
+    table_fluid = dict_file['Fluids'].iloc[:,1:].copy()
+    table_fluid['Time'] = pd.to_datetime(table_fluid['Time'])
+    table_fluid.sort_values(by='Time', inplace=True)
+
+    table_pressure = dict_file['Pressure'].iloc[:,1:].copy()
+    table_pressure['Time'] = pd.to_datetime(table_pressure['Time'])
+    table_pressure.sort_values(by='Time', inplace=True)
+
+    table_metadata = pd.merge(table_fluid, table_pressure, 
+                            on='Time', how='outer')
+    table_metadata['Machine'] = machine_name
+    return table_metadata
+
+def label_sessions(start_array, end_array, first_sess=1):
+    """
+    start/end 플래그로 한 장비의 이벤트에 세션 번호 부여 (0은 세션 아님)
+    세션은 start 행에서 시작해 그 행 이후 첫 end 행에서 완료되고, 다음 start 전의
+    end 행까지 연장됨. 세션 진행 중의 start는 무시하고, end가 없는 start는 버림
+    :param start_array: boolean array, 세션 시작 행
+    :param end_array: boolean array, 세션 종료 행
+    :param first_sess: 첫 세션 번호
+    :return: (세션 번호 array, 다음 세션 번호)
+    """
+    start_array = np.asarray(start_array, dtype=bool)
+    end_array = np.asarray(end_array, dtype=bool)
+    n_rows = len(start_array)
+    labels = np.zeros(n_rows, dtype=np.int64)
+
+    start_pos = np.flatnonzero(start_array)
+    end_pos = np.flatnonzero(end_array)
+    if len(start_pos) == 0 or len(end_pos) == 0:
+        return labels, first_sess
+
+    # 각 start 이후 첫 end, 그리고 그 end 다음의 첫 start
+    first_end_idx = np.searchsorted(end_pos, start_pos, side='left')
+    has_end = first_end_idx < len(end_pos)
+    first_end = end_pos[np.minimum(first_end_idx, len(end_pos) - 1)]
+    next_start_idx = np.searchsorted(start_pos, first_end, side='right')
+
+    # 세션을 여는 start만 따라감 (행 단위가 아닌 세션 수만큼 반복)
+    chain = []
+    i = 0
+    while i < len(start_pos) and has_end[i]:
+        chain.append(i)
+        i = next_start_idx[i]
+
+    if not chain:
+        return labels, first_sess
+
+    chain = np.asarray(chain)
+    sess_start = start_pos[chain]
+    next_start_idx = next_start_idx[chain]
+    bound = np.where(next_start_idx < len(start_pos),
+                     start_pos[np.minimum(next_start_idx, len(start_pos) - 1)],
+                     n_rows)
+    # 다음 세션 start 직전의 마지막 end까지 연장
+    sess_end = end_pos[np.searchsorted(end_pos, bound, side='left') - 1]
+
+    sess_ids = np.arange(first_sess, first_sess + len(chain), dtype=np.int64)
+    delta = np.zeros(n_rows + 1, dtype=np.int64)
+    delta[sess_start] += sess_ids
+    delta[sess_end + 1] -= sess_ids
+    labels = np.cumsum(delta[:-1])
+
+    return labels, first_sess + len(chain)
+
+def assign_sessions(merged_event, first_sess=1):
+    """
+    Machine, Time 순으로 정렬된 이벤트 테이블에 장비별 Sess 컬럼 부여
+    :return: 다음 세션 번호
+    """
+    start_array = (merged_event['PT_ID'].notna() & (merged_event['HD_start'] == 'O')).to_numpy()
+    end_array = merged_event['HD_end'].notna().to_numpy()
+    sess = np.zeros(merged_event.shape[0], dtype=np.int64)
+
+    sess_num = first_sess
+    for machine, idx in merged_event.groupby('Machine', sort=True).indices.items():
+        sess[idx], sess_num = label_sessions(start_array[idx], end_array[idx], sess_num)
+
+    merged_event['Sess'] = sess
+    return sess_num
+
+def assign_metadata_sessions(merged_metadata, merged_event):
+    """
+    각 metadata 행에 같은 장비에서 [세션 첫 이벤트 Time, 마지막 이벤트 Time] 구간이
+    포함하는 세션 번호 부여 (장비별 정렬된 구간에 대한 searchsorted join)
+    경계가 겹치면 뒤 세션 번호를 사용
+    """
+    sess_event = merged_event[merged_event['Sess'] != 0]
+    bounds = sess_event.groupby('Sess', sort=True).agg(
+        Machine=('Machine', 'first'), t_start=('Time', 'first'), t_end=('Time', 'last'))
+
+    times = merged_metadata['Time'].to_numpy()
+    sess = np.zeros(merged_metadata.shape[0], dtype=np.int64)
+
+    for machine, idx in merged_metadata.groupby('Machine', sort=False).indices.items():
+        machine_bounds = bounds[bounds['Machine'] == machine]
+        if machine_bounds.empty:
             continue
 
-        try:
-            try:
-                table_event = pd.DataFrame(dict_file['User events'][27:], 
-                                         columns=dict_file['User events'][26])
-            except:
-                table_event = pd.DataFrame(dict_file['User events'][27:], 
-                                         columns=dict_file['User events'][26]+['None'])
-
-            table_event = table_event.iloc[:,1:]
-            table_event = table_event[table_event['Time'].astype(str).str.strip() != '']
-            table_event['Time'] = table_event['Time'].astype(str).str[:-2] + '00'
-            
-            try:
-                table_event['Time'] = pd.to_datetime(table_event['Time'])
-            except Exception as e:
-                print(f"Error converting time in {t_file}: {str(e)}")
+        t_start = machine_bounds['t_start'].to_numpy()
+        t_end = machine_bounds['t_end'].to_numpy()
+        sess_ids = machine_bounds.index.to_numpy()
+
+        t = times[idx]
+        pos = np.searchsorted(t_start, t, side='right') - 1
+        inside = (pos >= 0) & (t <= t_end[np.maximum(pos, 0)])
+        sess[idx[inside]] = sess_ids[pos[inside]]
+
+    merged_metadata['Sess'] = sess
+
+final_table_names = ('merged_table_valid_all.csv', 'merged_metadata_all.csv')
+
+def write_final_tables(event_pieces, metadata_pieces, part=None):
+    """
+    그룹별 결과를 한 번에 병합해 merged_table_valid_all.csv / merged_metadata_all.csv에 저장
+    :param part: 지정하면 최종 파일 대신 part 번호의 임시 파일에 저장 (merge_final_parts로 병합)
+    """
+    final_events = pd.concat(event_pieces, ignore_index=True)
+    final_metadata = pd.concat(metadata_pieces, ignore_index=True)
+    final_events.sort_values(['Machine', 'Time'], inplace=True)
+    final_metadata.sort_values(['Machine', 'Time'], inplace=True)
+
+    for table, name in zip((final_events, final_metadata), final_table_names):
+        output_path = os.path.join(root_path, name)
+        if part is not None:
+            output_path += f'.part{part}'
+        table.to_csv(output_path, index=False)
+
+def merge_final_parts(n_parts):
+    """
+    write_final_tables로 나눠 쓴 임시 파일을 모든 part의 컬럼 합집합 헤더로 이어 붙여 최종 파일 생성
+    part에 없는 컬럼은 빈 값으로 채우고, 임시 파일은 삭제
+    """
+    for name in final_table_names:
+        output_path = os.path.join(root_path, name)
+        part_paths = [f'{output_path}.part{part}' for part in range(n_parts)]
+
+        headers = []
+        for path in part_paths:
+            with open(path, 'r', newline='', encoding='utf-8') as f:
+                headers.append(next(csv.reader(f)))
+        columns = list(dict.fromkeys(col for header in headers for col in header))
+
+        # pandas to_csv와 같은 줄바꿈으로 행을 그대로 옮겨 씀
+        with open(output_path, 'w', newline='', encoding='utf-8') as out:
+            writer = csv.writer(out, lineterminator=os.linesep)
+            writer.writerow(columns)
+            for path, header in zip(part_paths, headers):
+                positions = {col: i for i, col in enumerate(header)}
+                index = [positions.get(col) for col in columns]
+                with open(path, 'r', newline='', encoding='utf-8') as f:
+                    reader = csv.reader(f)
+                    next(reader)
+                    for row in reader:
+                        writer.writerow(['' if i is None else row[i] for i in index])
+                os.remove(path)
+
+# Parquet 데이터셋 컬럼 타입: 그룹마다 추론하지 않고 모든 그룹에 같은 schema를 사용해야
+# 데이터셋 전체를 한 번에 읽을 수 있음 (한 그룹에서 전부 NaN인 플래그 컬럼이 float으로 저장되는 문제 방지)
+# event_code_map 컬럼은 'O' 플래그와 설정값이 섞이므로 문자열로 저장
+parquet_column_types = {
+    'Time': pa.timestamp('ns'),
+    'Machine': pa.string(),
+    'Year': pa.int32(),
+    'Sess': pa.int64(),
+    **{code[2]: pa.string() for code in event_code_map},
+}
+# 위에 없는 컬럼 타입: User events는 문자열, Fluids / Pressure 측정값은 float
+# 숫자가 아닌 값이 기록되는 Fluids / Pressure 컬럼은 위에 pa.string()으로 추가 (없으면 Parquet 저장 시 에러)
+parquet_default_types = {'events': pa.string(), 'metadata': pa.float64()}
+
+def apply_parquet_schema(table, name):
+    """
+    parquet_column_types 기준으로 컬럼을 변환하고 pyarrow schema 반환
+    float 컬럼에 숫자로 읽을 수 없는 값이 있으면 CSV에는 남는 값을 잃지 않도록 ValueError 발생
+    :param name: 'events' 또는 'metadata'
+    :return: (변환된 DataFrame, pyarrow.Schema)
+    """
+    fields = []
+    for col in table.columns:
+        col_type = parquet_column_types.get(col, parquet_default_types[name])
+        if col_type == pa.string():
+            table[col] = table[col].astype(object).where(table[col].notna(), None)
+        elif col_type == pa.float64():
+            values = table[col].where(table[col].astype(str).str.strip() != '')
+            converted = pd.to_numeric(values, errors='coerce')
+            invalid = values[converted.isna() & values.notna()]
+            if len(invalid):
+                raise ValueError(f"{name}.{col}: {len(invalid)} non-numeric values "
+                                 f"(e.g. {invalid.unique()[:3].tolist()}), "
+                                 f"add '{col}' to parquet_column_types as pa.string()")
+            table[col] = converted.astype('float64')
+        fields.append(pa.field(str(col), col_type))
+    return table, pa.schema(fields)
+
+def write_parquet_tables(valid_events, valid_metadata, group_key):
+    """
+    그룹 결과를 parquet_save_path의 events / metadata 데이터셋에 Machine, Year 파티션으로 저장
+    같은 group_key로 이전에 저장한 파일은 교체
+    """
+    # 두 테이블 모두 변환한 뒤 저장 (변환 에러 시 events만 교체되지 않도록)
+    converted = []
+    for table, name in ((valid_events, 'events'), (valid_metadata, 'metadata')):
+        table = table.copy()
+        table['Year'] = table['Time'].dt.year
+        converted.append((*apply_parquet_schema(table, name), name))
+
+    for table, schema, name in converted:
+        dataset_path = os.path.join(parquet_save_path, name)
+        for old_file in glob.glob(os.path.join(dataset_path, '*', '*', f'{group_key}-*.parquet')):
+            os.remove(old_file)
+
+        table.to_parquet(dataset_path, index=False, partition_cols=['Machine', 'Year'], schema=schema,
+                         compression='zstd', basename_template=f'{group_key}-{{i}}.parquet')
+
+def remove_group_outputs(group_key):
+    """
+    그룹별 CSV와 Parquet 파일 삭제 (다시 만든 결과가 없거나 파일이 모두 사라진 그룹)
+    남겨두면 다음 실행에서 merged_*_all.csv나 Parquet 데이터셋에 이전 결과가 섞임
+    """
+    for name in ('merged_table_valid', 'merged_metadata'):
+        csv_path = os.path.join(base_save_path, f'{name}_{group_key}.csv')
+        if os.path.exists(csv_path):
+            os.remove(csv_path)
+
+    for old_file in glob.glob(os.path.join(parquet_save_path, '*', '*', '*', f'{group_key}-*.parquet')):
+        os.remove(old_file)
+        # 비어 있는 Year=, Machine= 파티션 폴더도 삭제
+        year_dir = os.path.dirname(old_file)
+        for directory in (year_dir, os.path.dirname(year_dir)):
+            if not os.listdir(directory):
+                os.rmdir(directory)
+
+def file_hash(fname, chunk_size=1024 * 1024):
+    """
+    Returns the sha1 hex digest of the file contents
+    """
+    h = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cache_file(fname, kind):
+    """
+    파일별 event / metadata 테이블 캐시 경로
+    """
+    key = hashlib.sha1(fname.encode('utf-8')).hexdigest()
+    return os.path.join(cache_path, f"{key}_{kind}.pkl")
+
+def load_manifest(path):
+    """
+    Loads the processed-file manifest
+    files: 경로별 size, mtime, hash, group, 캐시된 테이블 유무
+    sessions: "Machine|세션 시작 Time"별 세션 번호, next_sess: 다음 세션 번호
+    groups: 그룹별 group_statistics 결과
+    """
+    if not os.path.exists(path):
+        return {'files': {}, 'sessions': {}, 'next_sess': 1, 'groups': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest.setdefault('groups', {})
+    return manifest
+
+def save_manifest(manifest, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def split_changed_files(file_list, manifest):
+    """
+    manifest와 비교해 변경 없는 파일과 새로 디코딩할 파일로 분리
+    크기와 수정 시간이 같으면 변경 없음으로 보고, 다르면 내용 hash로 확인
+    :return: (변경 없는 파일 list, {새로 디코딩할 파일: hash})
+    """
+    unchanged = []
+    changed = {}
+    for fname in file_list:
+        entry = manifest['files'].get(fname)
+        stat = os.stat(fname)
+        cached = False
+
+        if entry is not None:
+            cached = all(os.path.exists(cache_file(fname, kind))
+                         for kind in ('events', 'metadata') if entry[kind])
+            if cached and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                unchanged.append(fname)
                 continue
-                
-            table_event.sort_values(by='Time', inplace=True)
-            table_event.reset_index(drop=True, inplace=True)
 
-            all_col = None
-            for i in range(len(list_type)):
-                try:
-                    curr_type = list_type[i]
-                    curr_type_t = list_type_t[i]
-                    curr_type_name = list_type_cod[i]
-                    
-                    col_sub = table_event[
-                        (table_event['Type(cod)'] == curr_type) & 
-                        (table_event['Type'] == curr_type_t)
-                    ][['Time', 'Sample']]
-                    
-                    col_sub['Sample'] = np.where(col_sub['Sample'].astype(str) == '', 'O', col_sub['Sample'])
-                    col_sub.rename(columns={'Sample': curr_type_name}, inplace=True)
-                    
-                    if all_col is None:
-                        all_col = col_sub
-                    else:
-                        all_col = pd.merge(all_col, col_sub, on='Time', how='outer')
-                except Exception as e:
-                    print(f"Error processing type {curr_type_name} in {t_file}: {str(e)}")
-                    continue
+        digest = file_hash(fname)
+        if entry is not None and cached and entry['hash'] == digest:
+            entry['size'], entry['mtime'] = stat.st_size, stat.st_mtime
+            unchanged.append(fname)
+            continue
 
-            if all_col is not None:
-                all_col.sort_values(by='Time', inplace=True)
-                all_col['Machine'] = machine_name
+        changed[fname] = digest
+    return unchanged, changed
 
-                if merged_event is None:
-                    merged_event = all_col
-                else:
-                    merged_event = pd.concat([merged_event, all_col], axis=0)
+def remove_missing_files(manifest, group_key, file_list):
+    """
+    그룹에서 사라진 파일을 manifest와 캐시에서 삭제
+    :return: 삭제된 파일 list
+    """
+    present = set(file_list)
+    removed = [fname for fname, entry in manifest['files'].items()
+               if entry['group'] == group_key and fname not in present]
+    for fname in removed:
+        for kind in ('events', 'metadata'):
+            if os.path.exists(cache_file(fname, kind)):
+                os.remove(cache_file(fname, kind))
+        del manifest['files'][fname]
+    return removed
+
+def load_cached_tables(fname, manifest):
+    entry = manifest['files'][fname]
+    all_col = pd.read_pickle(cache_file(fname, 'events')) if entry['events'] else None
+    table_metadata = pd.read_pickle(cache_file(fname, 'metadata')) if entry['metadata'] else None
+    return all_col, table_metadata
+
+def update_manifest_entry(manifest, fname, digest, group_key, all_col, table_metadata):
+    """
+    새로 디코딩한 파일의 테이블을 캐시에 저장하고 manifest 갱신
+    """
+    for table, kind in ((all_col, 'events'), (table_metadata, 'metadata')):
+        if table is not None:
+            table.to_pickle(cache_file(fname, kind))
+        elif os.path.exists(cache_file(fname, kind)):
+            os.remove(cache_file(fname, kind))
+
+    stat = os.stat(fname)
+    manifest['files'][fname] = {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'hash': digest,
+        'group': group_key,
+        'events': all_col is not None,
+        'metadata': table_metadata is not None,
+    }
+
+def stable_session_mapping(valid_events, manifest):
+    """
+    그룹 내 세션 번호를 (Machine, 세션 시작 Time) 기준으로 manifest에 기록된 번호로 변환
+    처음 나온 세션은 manifest의 next_sess부터 번호를 받음
+    """
+    starts = valid_events.groupby('Sess', sort=True).agg(
+        Machine=('Machine', 'first'), Time=('Time', 'min'))
+
+    sess_mapping = {}
+    for sess, machine, t_start in zip(starts.index, starts['Machine'], starts['Time']):
+        key = f"{machine}|{t_start:%Y-%m-%d %H:%M:%S}"
+        if key not in manifest['sessions']:
+            manifest['sessions'][key] = manifest['next_sess']
+            manifest['next_sess'] += 1
+        sess_mapping[sess] = manifest['sessions'][key]
+    return sess_mapping
+
+def iter_file_tables(file_list):
+    """
+    Yields (file path, event table, metadata table) for each lox file, 테이블이 없으면 None
+    """
+    for n, (t_file, dict_file) in enumerate(iter_loxfile_data(file_list, num_workers, lox_sections, as_tables=True)):
+        print(f"Processing file {n+1}/{len(file_list)}: {t_file}")
 
-        except Exception as e:
-            print(f"Error processing file {t_file}: {str(e)}")
+        machine_name = t_file.split('\\')[-3]
+        all_col = None
+        table_metadata = None
+
+        if not dict_file:
+            print(f"Skipping file {t_file} - No valid data")
+            yield t_file, all_col, table_metadata
             continue
 
-    if merged_event is not None:
-        merged_event.sort_values(by=['Machine', 'Time'], inplace=True)
-        merged_event.drop_duplicates(inplace=True)
-        merged_event.reset_index(drop=True, inplace=True)
-
-        # Session 처리
-        merged_event['Sess'] = 0
-        list_machine = merged_event['Machine'].drop_duplicates()
-        sess_num = 1
-
-        for n, machine in enumerate(list_machine):
-            machine_event = merged_event[merged_event['Machine'] == machine].copy()
-            start_array = (~machine_event['PT_ID'].isna()) & (machine_event['HD_start'] == 'O')
-            end_array = ~machine_event['HD_end'].isna()
-            idx_array = np.zeros(machine_event.shape[0])
-            find_start = True
-            find_pos = 0
-            find_end = machine_event.shape[0]
-            curr_start = None
-            curr_end = None
-            complete = 0
-
-            while find_pos != find_end:
-                if find_start:
-                    checker = start_array.iloc[find_pos]
-                    if checker:
-                        if complete == 1:
-                            idx_array[curr_start:curr_end+1] = sess_num
-                            complete = 0
-                            sess_num += 1
-                        curr_start = find_pos
-                        find_start = False
-                    else:
-                        checker = end_array.iloc[find_pos]
-                        if checker:
-                            curr_end = find_pos
-                        find_pos += 1
-                else:
-                    checker = end_array.iloc[find_pos]
-                    if checker:
-                        curr_end = find_pos
-                        complete = 1
-                        find_start = True
-                    find_pos += 1
-
-            if complete == 1:
-                idx_array[curr_start:curr_end+1] = sess_num
-                complete = 0
-                sess_num += 1
-
-            merged_event.loc[merged_event['Machine'] == machine,'Sess'] = idx_array
-
-        # Metadata 처리
-        print("\nProcessing metadata...")
-        merged_metadata = None
-        for n, t_file in enumerate(list_file_group):
-            print(f"Processing metadata file {n+1}/{len(list_file_group)}")
+        if 'User events' not in dict_file:
+            print(f"Skipping file {t_file} - No valid user events data")
+        else:
             try:
-                machine_name = t_file.split('\\')[-3]
-                dict_file = get_loxfile_data(t_file)
+                all_col = build_event_table(dict_file, t_file, machine_name)
+            except Exception as e:
+                print(f"Error processing file {t_file}: {str(e)}")
 
-                if not dict_file:
-                    continue
+        try:
+            table_metadata = build_metadata_table(dict_file, machine_name)
+        except Exception as e:
+            print(f"Error processing metadata for file {t_file}: {str(e)}")
+
+        yield t_file, all_col, table_metadata
+
+def build_valid_tables(event_pieces, metadata_pieces, folder_name, year):
+    """
+    그룹의 파일별 테이블을 병합하고 세션을 부여해 세션에 속한 행만 반환
+    :return: (valid_events, valid_metadata), 유효한 데이터가 없으면 (None, None)
+    """
+    if not event_pieces:
+        print(f"No valid events for {folder_name} {year}")
+        return None, None
 
-                if 'Fluids' in dict_file and 'Pressure' in dict_file:
-                    table_fluid = pd.DataFrame(dict_file['Fluids'][7:], 
-                                             columns=dict_file['Fluids'][6])
-                    table_fluid = table_fluid.iloc[:,1:]
-                    table_fluid['Time'] = pd.to_datetime(table_fluid['Time'])
-                    table_fluid.sort_values(by='Time', inplace=True)
+    merged_event = pd.concat(event_pieces, axis=0)
+    merged_event.sort_values(by=['Machine', 'Time'], inplace=True)
+    merged_event.drop_duplicates(inplace=True)
+    merged_event.reset_index(drop=True, inplace=True)
 
-                    table_pressure = pd.DataFrame(dict_file['Pressure'][7:], 
-                                               columns=dict_file['Pressure'][6])
-                    table_pressure = table_pressure.iloc[:,1:]
-                    table_pressure['Time'] = pd.to_datetime(table_pressure['Time'])
-                    table_pressure.sort_values(by='Time', inplace=True)
+    # Session 처리
+    assign_sessions(merged_event)
 
-                    table_metadata = pd.merge(table_fluid, table_pressure, 
-                                            on='Time', how='outer')
-                    table_metadata['Machine'] = machine_name
+    if not metadata_pieces:
+        print(f"No valid metadata for {folder_name} {year}")
+        return None, None
 
-                    if merged_metadata is None:
-                        merged_metadata = table_metadata
-                    else:
-                        merged_metadata = pd.concat([merged_metadata, table_metadata])
+    merged_metadata = pd.concat(metadata_pieces)
+    merged_metadata.sort_values(by=['Machine', 'Time'], inplace=True)
+    merged_metadata.drop_duplicates(inplace=True)
+    merged_metadata.reset_index(drop=True, inplace=True)
 
-            except Exception as e:
-                print(f"Error processing metadata for file {t_file}: {str(e)}")
-                continue
+    assign_metadata_sessions(merged_metadata, merged_event)
 
-        if merged_metadata is not None:
-            merged_metadata.sort_values(by=['Machine', 'Time'], inplace=True)
-            merged_metadata.drop_duplicates(inplace=True)
-            merged_metadata.reset_index(drop=True, inplace=True)
+    valid_events = merged_event[merged_event['Sess'] != 0].copy()
+    valid_metadata = merged_metadata[merged_metadata['Sess'] != 0].copy()
+    return valid_events, valid_metadata
 
-            merged_metadata['Sess'] = 0
-            for sess in merged_event['Sess'].unique():
-                if sess == 0:
-                    continue
-                curr_hd = merged_event[merged_event['Sess'] == sess]
-                t_start = curr_hd['Time'].iloc[0]
-                t_end = curr_hd['Time'].iloc[-1]
-                name_machine = curr_hd['Machine'].iloc[0]
-                mask = ((merged_metadata['Time'] >= t_start) & 
-                       (merged_metadata['Time'] <= t_end) & 
-                       (merged_metadata['Machine'] == name_machine))
-                merged_metadata.loc[mask, 'Sess'] = sess
-
-            # Save results for this group
-            if not os.path.exists(base_save_path):
-                os.makedirs(base_save_path)
-
-            valid_events = merged_event[merged_event['Sess'] != 0].copy()
-            valid_metadata = merged_metadata[merged_metadata['Sess'] != 0].copy()
-
-            # Sess 번호 재할당
-            max_sess = valid_events['Sess'].max()
-            sess_mapping = {old_sess: new_sess for old_sess, new_sess in 
-                        zip(sorted(valid_events['Sess'].unique()), 
-                            range(current_sess, current_sess + int(max_sess)))}
-            valid_events['Sess'] = valid_events['Sess'].map(sess_mapping)
-            valid_metadata['Sess'] = valid_metadata['Sess'].map(sess_mapping)
-
-            # 다음 그룹의 시작 세션 번호 업데이트
-            current_sess += int(max_sess)
-
-            # 개별 파일 저장
-            events_filename = f'merged_table_valid_{folder_name}_{year}.csv'
-            metadata_filename = f'merged_metadata_{folder_name}_{year}.csv'
-
-            valid_events.to_csv(os.path.join(base_save_path, events_filename), 
-                            index=False)
-            valid_metadata.to_csv(os.path.join(base_save_path, metadata_filename), 
-                            index=False)
-            
-            if final_events is None:
-                final_events = valid_events
+def group_statistics(valid_events, valid_metadata):
+    """
+    그룹 결과의 세션 / 이벤트 / metadata 수와 환자 ID (incremental 모드에서 manifest에 저장)
+    """
+    if valid_events is None:
+        return {'sessions': 0, 'events': 0, 'metadata': 0, 'patients': []}
+    return {
+        'sessions': int(valid_events['Sess'].nunique()),
+        'events': len(valid_events),
+        'metadata': len(valid_metadata),
+        'patients': sorted(str(pt_id) for pt_id in valid_events['PT_ID'].dropna().unique()),
+    }
+
+def read_group_csv(folder_name, year):
+    """
+    이전 실행에서 저장한 그룹별 CSV 읽기 (incremental 모드에서 변경 없는 그룹용)
+    :return: (valid_events, valid_metadata), 파일이 없으면 (None, None)
+    """
+    events_path = os.path.join(base_save_path, f'merged_table_valid_{folder_name}_{year}.csv')
+    metadata_path = os.path.join(base_save_path, f'merged_metadata_{folder_name}_{year}.csv')
+    if not os.path.exists(events_path) or not os.path.exists(metadata_path):
+        return None, None
+
+    valid_events = pd.read_csv(events_path, dtype=str)
+    valid_metadata = pd.read_csv(metadata_path, dtype=str)
+    valid_events['Time'] = pd.to_datetime(valid_events['Time'])
+    valid_metadata['Time'] = pd.to_datetime(valid_metadata['Time'])
+    return valid_events, valid_metadata
+
+def main():
+    # 만약 merge 폴더가 없다면 생성
+    if not os.path.exists(base_save_path):
+        os.makedirs(base_save_path)
+
+    if incremental:
+        manifest = load_manifest(manifest_path)
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_path)
+    elif output_format in ('parquet', 'both') and os.path.exists(parquet_save_path):
+        # Parquet 데이터셋은 그룹별로 파일이 추가되므로 이전 실행 결과를 삭제
+        shutil.rmtree(parquet_save_path)
+
+    # 최종 병합을 위한 그룹별 결과 (마지막에 한 번만 병합)
+    final_events = []
+    final_metadata = []
+    final_bytes = 0
+    final_parts = 0  # memory_limit_mb 초과로 임시 파일에 쓴 part 수
+    current_sess = 1  # 전체 세션 번호 추적용
+
+    # 최종 통계
+    total_sessions = 0
+    total_events = 0
+    total_metadata = 0
+    total_patients = set()
+
+    # .LOX 파일이 있는 모든 디렉토리 찾기
+    base_paths = find_lox_directories(root_path)
+
+    print("Found directories containing .LOX files:")
+    for path in base_paths:
+        path_count = len(glob.glob(os.path.join(path, '*.LOX')))
+        print(f"{path}: {path_count} files")
+
+    # 전체 파일 리스트 생성
+    list_file = []
+    for path in base_paths:
+        path_files = glob.glob(os.path.join(path, '*.LOX'))
+        list_file.extend(path_files)
+
+    print(f"\nTotal number of files found: {len(list_file)}")
+
+    # 파일들을 폴더별로 그룹화
+    grouped_files = group_files_by_folder(list_file)
+
+    # 그룹별 (변경 없는 파일, 새로 디코딩할 파일, 삭제된 파일, 다시 저장할지 여부)
+    # Machine, 연도 순으로 처리해 이어 쓰기 시에도 정렬 순서 유지
+    group_changes = {}
+    for (folder_name, year), files in sorted(grouped_files.items()):
+        group_key = f"{folder_name}_{year}"
+        if incremental:
+            cached_files, new_files = split_changed_files(files, manifest)
+            removed_files = remove_missing_files(manifest, group_key, files)
+            # 통계가 기록되지 않은 그룹도 캐시에서 다시 만듦
+            changed = bool(new_files or removed_files) or group_key not in manifest['groups']
+        else:
+            cached_files, new_files, removed_files, changed = [], dict.fromkeys(files), [], True
+        group_changes[(folder_name, year)] = (cached_files, new_files, removed_files, changed)
+
+    if incremental:
+        # 파일이 모두 사라진 그룹
+        current_groups = {f"{folder_name}_{year}" for folder_name, year in group_changes}
+        removed_groups = sorted(set(manifest['groups']) - current_groups)
+        for group_key in removed_groups:
+            print(f"\nRemoved group {group_key}")
+            remove_missing_files(manifest, group_key, [])
+            remove_group_outputs(group_key)
+            del manifest['groups'][group_key]
+        if removed_groups:
+            save_manifest(manifest, manifest_path)
+
+        # 변경된 그룹이 없으면 merged_*_all.csv는 이전 결과를 그대로 둠
+        rebuild_final = (bool(removed_groups) or
+                         any(changes[3] for changes in group_changes.values()) or
+                         not all(os.path.exists(os.path.join(root_path, name)) for name in final_table_names))
+    else:
+        rebuild_final = True
+
+    # 각 그룹별로 처리
+    for (folder_name, year), (cached_files, new_files, removed_files, changed) in group_changes.items():
+        group_key = f"{folder_name}_{year}"
+
+        if not changed:
+            # 변경 없는 그룹은 이전 결과를 그대로 사용 (merged_*_all.csv를 다시 쓸 때만 CSV를 읽음)
+            print(f"\nNo changes in {folder_name} {year}")
+            write_group = False
+            if rebuild_final and output_format in ('csv', 'both'):
+                valid_events, valid_metadata = read_group_csv(folder_name, year)
             else:
-                final_events = pd.concat([final_events, valid_events])
-    
-            if final_metadata is None:
-                final_metadata = valid_metadata
+                valid_events, valid_metadata = None, None
+        else:
+            print(f"\nProcessing {folder_name} {year}...")
+            if incremental:
+                print(f"{len(new_files)} new or changed, {len(cached_files)} cached, "
+                      f"{len(removed_files)} removed files")
+            write_group = True
+
+            # Event / Metadata 데이터 처리 (파일당 한 번만 디코딩)
+            event_pieces = []
+            metadata_pieces = []
+            for t_file in cached_files:
+                all_col, table_metadata = load_cached_tables(t_file, manifest)
+                if all_col is not None:
+                    event_pieces.append(all_col)
+                if table_metadata is not None:
+                    metadata_pieces.append(table_metadata)
+
+            for t_file, all_col, table_metadata in iter_file_tables(list(new_files)):
+                if all_col is not None:
+                    event_pieces.append(all_col)
+                if table_metadata is not None:
+                    metadata_pieces.append(table_metadata)
+                if incremental:
+                    update_manifest_entry(manifest, t_file, new_files[t_file], group_key,
+                                          all_col, table_metadata)
+
+            valid_events, valid_metadata = build_valid_tables(event_pieces, metadata_pieces,
+                                                              folder_name, year)
+            del event_pieces, metadata_pieces
+
+            if valid_events is not None:
+                # Sess 번호 재할당
+                if incremental:
+                    sess_mapping = stable_session_mapping(valid_events, manifest)
+                else:
+                    list_sess = sorted(valid_events['Sess'].unique())
+                    sess_mapping = {old_sess: new_sess for old_sess, new_sess in
+                                    zip(list_sess, range(current_sess, current_sess + len(list_sess)))}
+                    # 다음 그룹의 시작 세션 번호 업데이트
+                    current_sess += len(list_sess)
+
+                valid_events['Sess'] = valid_events['Sess'].map(sess_mapping)
+                valid_metadata['Sess'] = valid_metadata['Sess'].map(sess_mapping)
             else:
-                final_metadata = pd.concat([final_metadata, valid_metadata])
+                # 이전 실행의 그룹 결과가 남아 있으면 merged_*_all.csv / Parquet 데이터셋에 섞이므로 삭제
+                remove_group_outputs(group_key)
+
+        if write_group:
+            stats = group_statistics(valid_events, valid_metadata)
+            if incremental:
+                manifest['groups'][group_key] = stats
         else:
-            print(f"No valid metadata for {folder_name} {year}")
+            stats = manifest['groups'][group_key]
+        total_sessions += stats['sessions']
+        total_events += stats['events']
+        total_metadata += stats['metadata']
+        total_patients.update(stats['patients'])
+
+        if valid_events is not None:
+            if write_group and output_format in ('parquet', 'both'):
+                write_parquet_tables(valid_events, valid_metadata, group_key)
+
+            if output_format in ('csv', 'both'):
+                if write_group:
+                    # 개별 파일 저장
+                    events_filename = f'merged_table_valid_{folder_name}_{year}.csv'
+                    metadata_filename = f'merged_metadata_{folder_name}_{year}.csv'
+
+                    valid_events.to_csv(os.path.join(base_save_path, events_filename),
+                                    index=False)
+                    valid_metadata.to_csv(os.path.join(base_save_path, metadata_filename),
+                                    index=False)
+
+                if rebuild_final:
+                    final_events.append(valid_events)
+                    final_metadata.append(valid_metadata)
+
+                if rebuild_final and memory_limit_mb is not None:
+                    final_bytes += (valid_events.memory_usage(deep=True).sum() +
+                                    valid_metadata.memory_usage(deep=True).sum())
+                    if final_bytes > memory_limit_mb * 1024 ** 2:
+                        write_final_tables(final_events, final_metadata, final_parts)
+                        final_parts += 1
+                        final_events, final_metadata, final_bytes = [], [], 0
+
+        # 그룹 결과를 저장한 뒤 manifest 갱신
+        if incremental and write_group:
+            save_manifest(manifest, manifest_path)
+
+        print("\nAll processing complete!")
+
+    # 최종 병합 파일 저장
+    if final_parts:
+        if final_events:
+            write_final_tables(final_events, final_metadata, final_parts)
+            final_parts += 1
+        merge_final_parts(final_parts)
+    elif final_events:
+        write_final_tables(final_events, final_metadata)
+    elif not rebuild_final and output_format in ('csv', 'both'):
+        print("\nNo changed groups, merged_*_all.csv not rewritten")
+
+    if total_events > 0:
+        print("\nFinal Statistics:")
+        print(f"Total sessions: {total_sessions}")
+        print(f"Total unique patients: {len(total_patients)}")
+        print(f"Total events: {total_events}")
+        print(f"Total metadata records: {total_metadata}")
+        print("\nFiles saved:")
+        if output_format in ('csv', 'both'):
+            print(f"Individual files: {base_save_path}")
+            print(f"Merged files: {root_path}")
+            print("  - merged_table_valid_all.csv")
+            print("  - merged_metadata_all.csv")
+        if output_format in ('parquet', 'both'):
+            print(f"Parquet datasets: {parquet_save_path}")
+            print("  - events/Machine=*/Year=*")
+            print("  - metadata/Machine=*/Year=*")
     else:
-        print(f"No valid events for {folder_name} {year}")
+        print("No valid data was processed")
 
-    print("\nAll processing complete!")
-
-# 최종 병합 파일 저장
-if final_events is not None and final_metadata is not None:
-    final_events.sort_values(['Machine', 'Time']).reset_index(drop=True).to_csv(
-        os.path.join(root_path, 'merged_table_valid_all.csv'), index=False)
-    final_metadata.sort_values(['Machine', 'Time']).reset_index(drop=True).to_csv(
-        os.path.join(root_path, 'merged_metadata_all.csv'), index=False)
- 
-    print("\nFinal Statistics:")
-    print(f"Total sessions: {final_events['Sess'].max()}")
-    print(f"Total unique patients: {final_events['PT_ID'].nunique()}")
-    print(f"Total events: {len(final_events)}")
-    print(f"Total metadata records: {len(final_metadata)}")
-    print("\nFiles saved:")
-    print(f"Individual files: {base_save_path}")
-    print(f"Merged files: {root_path}")
-    print("  - merged_table_valid_all.csv")
-    print("  - merged_metadata_all.csv")
-else:
-    print("No valid data was processed")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
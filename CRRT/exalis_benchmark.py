@@ -0,0 +1,81 @@
+import random
+import time
+
+from exalis_extract import extract_column_and_value, parse_line_prefix
+
+def is_korean(char):
+    """한글인지 확인하는 함수"""
+    return ord('가') <= ord(char) <= ord('힣') or ord('ㄱ') <= ord(char) <= ord('ㅎ')
+
+def extract_column_and_value_legacy(line):
+    """기존 토큰/문자 단위 파서 (비교용, Operating Phase 처리 포함)"""
+    parts = line.strip().split()
+    if len(parts) < 2:
+        return None, None
+
+    korean_idx = -1
+    for i, part in enumerate(parts):
+        if any(is_korean(c) for c in part):
+            korean_idx = i
+            break
+
+    if korean_idx != -1:
+        column_parts = parts[:korean_idx]
+    else:
+        column_parts = parts[:-1]
+
+    column_name = ' '.join(column_parts).strip()
+    value = parts[-1] if parts else None
+
+    if column_name == "Operating Phase":
+        if korean_idx != -1 and korean_idx < len(parts) - 1:
+            value = ' '.join(parts[korean_idx + 1:])
+
+    return column_name, value
+
+def make_synthetic_lines(n_lines, seed=0):
+    """Exalis 스냅샷과 비슷한 형식의 라인 생성"""
+    rng = random.Random(seed)
+    fields = [
+        ('Blood Flow', '혈류량'), ('Arterial Pressure', '동맥압'), ('Venous Pressure', '정맥압'),
+        ('TMP', '막간압'), ('UF Rate', '제수속도'), ('Dialysate Flow', '투석액 유량'),
+        ('Remaining Time', '남은시간'), ('Substitution Rate', '치환액 속도'), ('Heparin', 'ㅎ파린'),
+    ]
+    phases = ['Priming Mode', 'Treatment', 'Rinse Back', 'End']
+
+    lines = []
+    for _ in range(n_lines):
+        r = rng.random()
+        if r < 0.1:
+            lines.append(f"Operating Phase 운전단계 {rng.choice(phases)}")
+        elif r < 0.15:
+            lines.append("Alarm Status 알람")
+        elif r < 0.2:
+            lines.append(f"Software Version {rng.randint(1, 9)}.{rng.randint(0, 9)}")
+        else:
+            name, label = rng.choice(fields)
+            lines.append(f"{name}  {label}\t{rng.uniform(-200, 400):.1f} ")
+    return lines
+
+def benchmark_line_parser(n_lines=500000, repeat=3):
+    lines = make_synthetic_lines(n_lines)
+
+    mismatches = sum(1 for line in lines
+                     if extract_column_and_value(line) != extract_column_and_value_legacy(line))
+    print(f"Lines: {n_lines:,}, mismatches: {mismatches}")
+
+    for name, func in (('legacy', extract_column_and_value_legacy), ('regex', extract_column_and_value)):
+        parse_line_prefix.cache_clear()
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for line in lines:
+                func(line)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:>8}: {best:.3f}s ({n_lines / best:,.0f} lines/sec)")
+
+    print(f"prefix cache: {parse_line_prefix.cache_info()}")
+
+if __name__ == "__main__":
+    benchmark_line_parser()
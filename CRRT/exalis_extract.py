@@ -1,11 +1,21 @@
+import csv
+import heapq
+import json
 import os
+import re
+import shutil
+import tempfile
+import time
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
+from functools import lru_cache
 from tqdm import tqdm
 
-def is_korean(char):
-    """한글인지 확인하는 함수"""
-    return ord('가') <= ord(char) <= ord('힣') or ord('ㄱ') <= ord(char) <= ord('ㅎ')
+# 한글(완성형, 자음)이 포함된 첫 토큰
+KOREAN_TOKEN = re.compile(r'\S*[가-힣ㄱ-ㅎ]\S*')
 
 def extract_datetime_from_filename(filename):
     """파일명에서 날짜시간 추출"""
@@ -18,108 +28,464 @@ def extract_datetime_from_filename(filename):
         return None
     return None
 
+def list_device_files(folder_path, since=None, min_age=None):
+    """
+    장비 폴더의 Exalis 텍스트 파일 목록
+    since(YYYYMMDDHHMMSS)가 있으면 파일명 시간이 since 이후인 파일만 반환
+    min_age(초)가 있으면 최근 min_age초 안에 수정된(아직 쓰는 중일 수 있는) 파일과 그보다 파일명 시간이
+    늦은 파일은 제외 (state가 그 파일을 건너뛰지 않도록 다음 실행에서 처리)
+    """
+    txt_files = [f for f in os.listdir(folder_path) if f.endswith('.txt')]
+    if since is not None:
+        txt_files = [f for f in txt_files if f.split('_')[0] > since]
+    if min_age is not None:
+        cutoff = time.time() - min_age
+        recent = [f.split('_')[0] for f in txt_files if os.path.getmtime(os.path.join(folder_path, f)) > cutoff]
+        if recent:
+            txt_files = [f for f in txt_files if f.split('_')[0] < min(recent)]
+    return txt_files
+
+def last_file_timestamp(txt_files, since=None):
+    """처리한 파일 중 가장 늦은 파일명 시간 (다음 증분 실행의 기준), 없으면 since 그대로"""
+    return max((f.split('_')[0] for f in txt_files if extract_datetime_from_filename(f)), default=since)
+
+def load_state(path):
+    """증분 처리 상태 로드: device_id별 마지막으로 처리한 파일명 시간"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_state(state, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+@lru_cache(maxsize=4096)
+def parse_line_prefix(prefix):
+    """값을 제외한 라인 앞부분에서 (컬럼명, 한글 라벨 끝 위치) 추출, 같은 앞부분은 캐시 사용"""
+    match = KOREAN_TOKEN.search(prefix)
+    if match:
+        # 컬럼명 추출 (한글 전까지의 모든 영문)
+        return ' '.join(prefix[:match.start()].split()), match.end()
+    return ' '.join(prefix.split()), None
+
 def extract_column_and_value(line):
     """라인에서 컬럼명과 값을 추출하는 함수"""
-    parts = line.strip().split()
+    line = line.strip()
+    parts = line.rsplit(None, 1)
     if len(parts) < 2:
         return None, None
-        
-    # 한글이 나오는 위치 찾기
-    korean_idx = -1
-    for i, part in enumerate(parts):
-        if any(is_korean(c) for c in part):
-            korean_idx = i
-            break
-    
-    # 컬럼명 추출 (한글 전까지의 모든 영문)
-    if korean_idx != -1:
-        column_parts = parts[:korean_idx]
-    else:
-        column_parts = parts[:-1]
-    
-    column_name = ' '.join(column_parts).strip()
-    
-    # 값 추출
-    value = parts[-1] if parts else None
-        
+
+    # 값은 마지막 토큰
+    prefix, value = parts
+    column_name, label_end = parse_line_prefix(prefix)
+
+    # Operating Phase는 한글 라벨 다음의 모든 값을 합침
+    if column_name == "Operating Phase" and label_end is not None:
+        value = ' '.join(line[label_end:].split())
+
     return column_name, value
 
-def process_dialysis_files(base_directory):
-    all_data = []
-    all_columns = set()
-    
-    folders = [f for f in os.listdir(base_directory) if os.path.isdir(os.path.join(base_directory, f))]
-    
-    for folder_name in tqdm(folders, desc="Processing folders", unit="folder"):
-        folder_path = os.path.join(base_directory, folder_name)
-        txt_files = [f for f in os.listdir(folder_path) if f.endswith('.txt')]
-        
-        for filename in tqdm(txt_files, desc=f"Processing {folder_name}", unit="file", leave=False):
-            file_path = os.path.join(folder_path, filename)
-            
+def parse_exalis_file(folder_path, folder_name, filename):
+    """Exalis 텍스트 파일 하나를 읽어 레코드(dict)로 변환, 시간 정보가 없으면 None"""
+    file_path = os.path.join(folder_path, filename)
+
+    # 파일을 한 번에 읽고 닫은 뒤 라인 단위로 처리
+    with open(file_path, 'r', encoding='utf-8') as file:
+        lines = file.read().split('\n')
+
+    data = {
+        'device_id': folder_name,
+        'filename': filename
+    }
+
+    # 첫 줄에서 시간 정보 추출
+    try:
+        timestamp_str = lines[0].strip().split()[-1]
+        if len(timestamp_str.split()) == 1:  # HH:MM:SS 형식인 경우
+            # 파일명에서 날짜 추출
+            datetime_str = extract_datetime_from_filename(filename)
+            if datetime_str:
+                data['EQTIME'] = datetime_str
+            else:
+                return None
+        else:
+            data['EQTIME'] = timestamp_str
+    except:
+        return None
+
+    # 나머지 라인 처리
+    for line in lines[1:]:
+        if not line.strip():
+            continue
+
+        column_name, value = extract_column_and_value(line)
+
+        if column_name and value:
             try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    data = {
-                        'device_id': folder_name,
-                        'filename': filename
-                    }
-                    
-                    # 첫 줄에서 시간 정보 추출
-                    first_line = file.readline()
-                    try:
-                        timestamp_str = first_line.strip().split()[-1]
-                        if len(timestamp_str.split()) == 1:  # HH:MM:SS 형식인 경우
-                            # 파일명에서 날짜 추출
-                            datetime_str = extract_datetime_from_filename(filename)
-                            if datetime_str:
-                                data['EQTIME'] = datetime_str
-                            else:
-                                continue
-                        else:
-                            data['EQTIME'] = timestamp_str
-                    except:
-                        continue
-                    
-                    # 나머지 라인 처리
-                    for line in file:
-                        if not line.strip():
-                            continue
-                            
-                        column_name, value = extract_column_and_value(line)
-                        
-                        if column_name and value:
-                            # Operating Phase와 같은 특별한 경우 처리
-                            if column_name == "Operating Phase":
-                                # 한글 다음의 모든 값을 합침
-                                korean_idx = -1
-                                parts = line.strip().split()
-                                for i, part in enumerate(parts):
-                                    if any(is_korean(c) for c in part):
-                                        korean_idx = i
-                                        break
-                                if korean_idx != -1 and korean_idx < len(parts) - 1:
-                                    value = ' '.join(parts[korean_idx + 1:])
-                            
-                            # 컬럼 목록에 추가
-                            all_columns.add(column_name)
-                            
-                            try:
-                                # 숫자형 데이터 변환 시도
-                                if value.replace('.', '').replace('-', '').isdigit():
-                                    data[column_name] = float(value)
-                                else:
-                                    data[column_name] = value
-                            except ValueError:
-                                data[column_name] = value
-
-                    all_data.append(data)
-                    
-            except Exception as e:
-                print(f"\nError processing file {file_path}: {str(e)}")
+                # 숫자형 데이터 변환 시도
+                if value.replace('.', '').replace('-', '').isdigit():
+                    data[column_name] = float(value)
+                else:
+                    data[column_name] = value
+            except ValueError:
+                data[column_name] = value
+
+    return data
+
+def build_long_table(records):
+    """레코드 list를 (device_id, EQTIME, column, value) long 형식 DataFrame으로 변환"""
+    device_ids, eqtimes, columns, values = [], [], [], []
+    for data in records:
+        for column_name, value in data.items():
+            if column_name in ('device_id', 'filename', 'EQTIME'):
                 continue
-    
+            device_ids.append(data['device_id'])
+            eqtimes.append(data['EQTIME'])
+            columns.append(column_name)
+            values.append(value)
+
+    return pd.DataFrame({
+        'device_id': device_ids,
+        'EQTIME': pd.to_datetime(pd.Series(eqtimes, dtype=object)),
+        'column': columns,
+        'value': pd.Series(values, dtype=object),
+    })
+
+# long Parquet 데이터셋의 파티션 컬럼 타입
+# 파티션 값은 폴더명에만 저장되어 읽을 때 타입을 추론하므로, 장비 폴더명이 모두 숫자이면 '007'이 7(int)로 읽힘
+# 데이터셋을 읽을 때는 read_long_parquet 또는 pd.read_parquet(..., partitioning=LONG_PARQUET_PARTITIONING) 사용
+LONG_PARQUET_PARTITIONING = ds.partitioning(pa.schema([('device_id', pa.string()), ('date', pa.string())]),
+                                            flavor='hive')
+
+def write_long_parquet(df, output_dir):
+    """
+    long 테이블을 device_id / date로 파티션된 Parquet 데이터셋으로 저장
+    숫자 값은 value(float), 문자 값은 value_text 컬럼에 저장 (읽을 때는 read_long_parquet 사용)
+    """
+    table = df[['device_id', 'EQTIME', 'column']].copy()
+    table['value'] = pd.to_numeric(df['value'], errors='coerce')
+    table['value_text'] = df['value'].where(table['value'].isna()).astype('string')
+    table['date'] = table['EQTIME'].dt.strftime('%Y-%m-%d')
+    table.to_parquet(output_dir, index=False, partition_cols=['device_id', 'date'], compression='zstd')
+
+def read_long_parquet(output_dir, **kwargs):
+    """write_long_parquet 데이터셋 읽기, device_id와 date는 문자열로 읽음 (kwargs는 pd.read_parquet에 전달)"""
+    return pd.read_parquet(output_dir, partitioning=LONG_PARQUET_PARTITIONING, **kwargs)
+
+def iter_device_records(folder_path, folder_name, txt_files, show_progress=True):
+    """장비 폴더의 텍스트 파일을 차례로 파싱해 레코드를 하나씩 반환 (시간 정보가 없거나 에러가 난 파일은 제외)"""
+    for filename in tqdm(txt_files, desc=f"Processing {folder_name}", unit="file", leave=False,
+                         disable=not show_progress):
+        try:
+            data = parse_exalis_file(folder_path, folder_name, filename)
+        except Exception as e:
+            print(f"\nError processing file {os.path.join(folder_path, filename)}: {str(e)}")
+            continue
+
+        if data is not None:
+            yield data
+
+def process_device_folder(base_directory, folder_name, show_progress=True, long_format=False, since=None,
+                          min_age=None):
+    """
+    장비 폴더 하나의 텍스트 파일 처리, (레코드 list, 컬럼 set, 파일 수, 마지막 파일명 시간) 반환
+    long_format이면 레코드 list 대신 build_long_table 결과 반환
+    since, min_age는 list_device_files 참고
+    """
+    folder_path = os.path.join(base_directory, folder_name)
+    txt_files = list_device_files(folder_path, since, min_age)
+
+    records = []
+    columns = set()
+    for data in iter_device_records(folder_path, folder_name, txt_files, show_progress):
+        columns.update(k for k in data if k not in ('device_id', 'filename', 'EQTIME'))
+        records.append(data)
+
+    if long_format:
+        records = build_long_table(records)
+
+    return records, columns, len(txt_files), last_file_timestamp(txt_files, since)
+
+def write_device_long(base_directory, folder_name, output_format, output_path, show_progress=True, since=None,
+                      min_age=None):
+    """
+    장비 폴더 하나의 long 테이블을 만들어 바로 저장 (부모 프로세스로 테이블을 넘기지 않음)
+    output_format이 'parquet'이면 output_path 데이터셋의 device_id 파티션에, 'long'이면 output_path CSV로 저장
+    (행 수, 컬럼 set, 파일 수, 마지막 파일명 시간, (처음 EQTIME, 마지막 EQTIME)) 반환
+    """
+    df, columns, n_files, last_timestamp = process_device_folder(base_directory, folder_name, show_progress,
+                                                                 long_format=True, since=since, min_age=min_age)
+    if len(df) == 0:
+        return 0, columns, n_files, last_timestamp, None
+
+    df = df.sort_values('EQTIME', kind='stable')
+    if output_format == 'parquet':
+        write_long_parquet(df, output_path)
+    else:
+        df.to_csv(output_path, index=False)
+    return len(df), columns, n_files, last_timestamp, (df['EQTIME'].iloc[0], df['EQTIME'].iloc[-1])
+
+def write_sorted_run(records, columns, run_path):
+    """레코드를 EQTIME 순으로 정렬해 하나의 임시 CSV(run) 파일로 저장"""
+    records.sort(key=lambda data: data['EQTIME'])
+    fieldnames = ['device_id', 'filename', 'EQTIME'] + sorted(columns)
+    with open(run_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(records)
+
+def spill_device_folder(base_directory, folder_name, spill_dir, chunk_size=50000, show_progress=True, min_age=None):
+    """
+    장비 폴더 하나를 처리하면서 chunk_size 레코드마다 정렬된 run 파일로 저장
+    (run 파일 경로 list, 컬럼 set, 파일 수, 레코드 수, 마지막 파일명 시간) 반환
+    """
+    folder_path = os.path.join(base_directory, folder_name)
+    txt_files = list_device_files(folder_path, min_age=min_age)
+
+    run_paths = []
+    columns = set()
+    n_records = 0
+    chunk = []
+    chunk_columns = set()
+    for data in iter_device_records(folder_path, folder_name, txt_files, show_progress):
+        chunk_columns.update(k for k in data if k not in ('device_id', 'filename', 'EQTIME'))
+        chunk.append(data)
+
+        if len(chunk) >= chunk_size:
+            run_path = os.path.join(spill_dir, f"{folder_name}_{len(run_paths):05d}.csv")
+            write_sorted_run(chunk, chunk_columns, run_path)
+            run_paths.append(run_path)
+            columns.update(chunk_columns)
+            n_records += len(chunk)
+            chunk, chunk_columns = [], set()
+
+    if chunk:
+        run_path = os.path.join(spill_dir, f"{folder_name}_{len(run_paths):05d}.csv")
+        write_sorted_run(chunk, chunk_columns, run_path)
+        run_paths.append(run_path)
+        columns.update(chunk_columns)
+        n_records += len(chunk)
+
+    return run_paths, columns, len(txt_files), n_records, last_file_timestamp(txt_files)
+
+def merge_sorted_runs(run_paths, fieldnames, output_path):
+    """정렬된 run 파일들을 (device_id, EQTIME) 순으로 k-way 병합해 하나의 CSV로 저장"""
+    files = [open(run_path, 'r', encoding='utf-8', newline='') for run_path in run_paths]
+    try:
+        readers = [csv.DictReader(f) for f in files]
+        with open(output_path, 'w', encoding='utf-8', newline='') as out:
+            # 없는 컬럼은 빈 값으로 저장 (DataFrame.to_csv의 NaN과 동일)
+            writer = csv.DictWriter(out, fieldnames=fieldnames, restval='', lineterminator=os.linesep)
+            writer.writeheader()
+            for row in heapq.merge(*readers, key=lambda row: (row['device_id'], row['EQTIME'])):
+                writer.writerow(row)
+    finally:
+        for f in files:
+            f.close()
+
+def stream_dialysis_files(base_directory, output_path, num_workers=1, chunk_size=50000, state=None, min_age=None):
+    """
+    process_dialysis_files와 같은 wide CSV를 전체 데이터를 메모리에 올리지 않고 저장
+    장비별로 chunk_size 레코드씩 정렬된 run 파일을 만든 뒤 k-way 병합
+    state가 있으면 device_id별 마지막 파일명 시간을 기록, min_age는 list_device_files 참고
+    (장비별 레코드 수 dict, 컬럼 list) 반환
+    """
+    results = {}
+    start_time = time.perf_counter()
+
+    folders = sorted(f for f in os.listdir(base_directory) if os.path.isdir(os.path.join(base_directory, f)))
+
+    # run 파일은 출력 파일과 같은 디스크의 임시 폴더에 저장
+    spill_dir = tempfile.mkdtemp(prefix='exalis_runs_', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        if num_workers <= 1:
+            for folder_name in tqdm(folders, desc="Processing folders", unit="folder"):
+                results[folder_name] = spill_device_folder(base_directory, folder_name, spill_dir, chunk_size,
+                                                           min_age=min_age)
+        else:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                futures = {executor.submit(spill_device_folder, base_directory, folder_name, spill_dir,
+                                           chunk_size, False, min_age): folder_name
+                           for folder_name in folders}
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Processing folders", unit="folder"):
+                    folder_name = futures[future]
+                    try:
+                        results[folder_name] = future.result()
+                    except Exception as e:
+                        print(f"\nError processing folder {folder_name}: {str(e)}")
+
+        run_paths = []
+        all_columns = set()
+        total_files = 0
+        device_counts = {}
+        for folder_name in folders:
+            if folder_name in results:
+                paths, columns, n_files, n_records, last_timestamp = results[folder_name]
+                run_paths.extend(paths)
+                all_columns.update(columns)
+                total_files += n_files
+                if n_records:
+                    device_counts[folder_name] = n_records
+                if state is not None and last_timestamp is not None:
+                    state[folder_name] = last_timestamp
+
+        elapsed = time.perf_counter() - start_time
+        print(f"\nRead {total_files:,} files in {elapsed:.1f}s "
+              f"({total_files / elapsed if elapsed > 0 else 0:,.0f} files/sec)")
+
+        base_columns = ['device_id', 'filename', 'EQTIME', 'Operating Phase', 'Remaining Time']
+        other_columns = sorted(list(all_columns - set(base_columns)))
+        final_columns = [col for col in base_columns + other_columns
+                         if col in all_columns or col in ('device_id', 'filename', 'EQTIME')]
+
+        print(f"\nMerging {len(run_paths)} sorted runs...")
+        merge_sorted_runs(run_paths, final_columns, output_path)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    return device_counts, final_columns
+
+def write_long_dialysis_files(base_directory, output_path, output_format='long', num_workers=1, state=None,
+                              append=False, min_age=None):
+    """
+    장비 폴더별 long 테이블을 만들자마자 저장해 전체 long 테이블을 메모리에 모으지 않음
+    'parquet': 각 장비가 output_path 데이터셋의 device_id / date 파티션에 바로 저장
+    'long': 장비별 임시 CSV를 장비 폴더 순서로 이어 붙여 output_path에 저장 (append이면 기존 파일 뒤에 추가)
+    state(device_id별 마지막 파일명 시간)가 있으면 그 이후 파일만 처리하고 state를 갱신
+    min_age는 list_device_files 참고
+    (장비별 행 수 dict, 컬럼 set, (처음 EQTIME, 마지막 EQTIME)) 반환
+    """
+    results = {}
+    start_time = time.perf_counter()
+
+    folders = sorted(f for f in os.listdir(base_directory) if os.path.isdir(os.path.join(base_directory, f)))
+
+    if output_format == 'parquet':
+        part_dir = None
+        part_paths = {folder_name: output_path for folder_name in folders}
+    else:
+        # 장비별 CSV는 출력 파일과 같은 디스크의 임시 폴더에 저장
+        part_dir = tempfile.mkdtemp(prefix='exalis_long_', dir=os.path.dirname(os.path.abspath(output_path)))
+        part_paths = {folder_name: os.path.join(part_dir, f"{folder_name}.csv") for folder_name in folders}
+
+    try:
+        if num_workers <= 1:
+            for folder_name in tqdm(folders, desc="Processing folders", unit="folder"):
+                since = state.get(folder_name) if state is not None else None
+                results[folder_name] = write_device_long(base_directory, folder_name, output_format,
+                                                         part_paths[folder_name], since=since, min_age=min_age)
+        else:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                futures = {executor.submit(write_device_long, base_directory, folder_name, output_format,
+                                           part_paths[folder_name], False,
+                                           state.get(folder_name) if state is not None else None,
+                                           min_age): folder_name
+                           for folder_name in folders}
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Processing folders", unit="folder"):
+                    folder_name = futures[future]
+                    try:
+                        results[folder_name] = future.result()
+                    except Exception as e:
+                        print(f"\nError processing folder {folder_name}: {str(e)}")
+
+        all_columns = set()
+        total_files = 0
+        device_counts = {}
+        time_range = None
+        for folder_name in folders:
+            if folder_name in results:
+                n_rows, columns, n_files, last_timestamp, device_range = results[folder_name]
+                all_columns.update(columns)
+                total_files += n_files
+                if n_rows:
+                    device_counts[folder_name] = n_rows
+                    time_range = device_range if time_range is None else (
+                        min(time_range[0], device_range[0]), max(time_range[1], device_range[1]))
+                if state is not None and last_timestamp is not None:
+                    state[folder_name] = last_timestamp
+
+        elapsed = time.perf_counter() - start_time
+        print(f"\nRead {total_files:,} files in {elapsed:.1f}s "
+              f"({total_files / elapsed if elapsed > 0 else 0:,.0f} files/sec)")
+
+        if part_dir is not None:
+            # 장비 폴더 순서로 이어 붙이면 (device_id, EQTIME) 순으로 정렬된 CSV가 됨
+            write_header = not (append and os.path.exists(output_path))
+            with open(output_path, 'a' if append else 'w', encoding='utf-8', newline='') as out:
+                if write_header:
+                    out.write(','.join(build_long_table([]).columns) + os.linesep)
+                for folder_name in folders:
+                    if device_counts.get(folder_name):
+                        with open(part_paths[folder_name], 'r', encoding='utf-8', newline='') as f:
+                            f.readline()
+                            shutil.copyfileobj(f, out)
+    finally:
+        if part_dir is not None:
+            shutil.rmtree(part_dir, ignore_errors=True)
+
+    return device_counts, all_columns, time_range
+
+def process_dialysis_files(base_directory, num_workers=1, state=None, min_age=None):
+    """
+    장비 폴더별로 Exalis 파일을 읽어 하나의 DataFrame으로 병합
+    num_workers > 1이면 장비 폴더를 프로세스 풀에 나누어 병렬 처리
+    long 형식 / Parquet 출력은 장비별로 바로 저장하는 write_long_dialysis_files 사용
+    state(device_id별 마지막 파일명 시간)가 있으면 그 이후 파일만 처리하고 state를 갱신
+    min_age는 list_device_files 참고
+    """
+    all_data = []
+    all_columns = set()
+    total_files = 0
+    start_time = time.perf_counter()
+
+    folders = sorted(f for f in os.listdir(base_directory) if os.path.isdir(os.path.join(base_directory, f)))
+
+    if num_workers <= 1:
+        for folder_name in tqdm(folders, desc="Processing folders", unit="folder"):
+            since = state.get(folder_name) if state is not None else None
+            records, columns, n_files, last_timestamp = process_device_folder(
+                base_directory, folder_name, since=since, min_age=min_age)
+            all_data.extend(records)
+            all_columns.update(columns)
+            total_files += n_files
+            if state is not None and last_timestamp is not None:
+                state[folder_name] = last_timestamp
+    else:
+        results = {}
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = {executor.submit(process_device_folder, base_directory, folder_name, False, False,
+                                       state.get(folder_name) if state is not None else None,
+                                       min_age): folder_name
+                       for folder_name in folders}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Processing folders", unit="folder"):
+                folder_name = futures[future]
+                try:
+                    results[folder_name] = future.result()
+                except Exception as e:
+                    print(f"\nError processing folder {folder_name}: {str(e)}")
+
+        # 장비 폴더 순서대로 병합
+        for folder_name in folders:
+            if folder_name in results:
+                records, columns, n_files, last_timestamp = results.pop(folder_name)
+                all_data.extend(records)
+                all_columns.update(columns)
+                total_files += n_files
+                if state is not None and last_timestamp is not None:
+                    state[folder_name] = last_timestamp
+
+    elapsed = time.perf_counter() - start_time
+    print(f"\nRead {total_files:,} files in {elapsed:.1f}s "
+          f"({total_files / elapsed if elapsed > 0 else 0:,.0f} files/sec)")
+
     print("\nCreating DataFrame and sorting data...")
-    
+
+    if not all_data:
+        return pd.DataFrame(columns=['device_id', 'filename', 'EQTIME'])
+
     df = pd.DataFrame(all_data)
     
     base_columns = ['device_id', 'filename', 'EQTIME', 'Operating Phase', 'Remaining Time']
@@ -134,29 +500,152 @@ def process_dialysis_files(base_directory):
     
     return df
 
+def append_csv(df, output_path):
+    """
+    기존 CSV 뒤에 새 행을 추가 (파일이 없으면 새로 저장)
+    기존 헤더에 없는 컬럼이 생기면 헤더 뒤에 컬럼을 추가해 파일 전체를 다시 저장
+    (기존 행은 타입 추론 없이 문자열 그대로 옮겨 '007' 같은 값이 바뀌지 않게 함)
+    """
+    if not os.path.exists(output_path):
+        df.to_csv(output_path, index=False)
+        return
+
+    with open(output_path, 'r', encoding='utf-8', newline='') as f:
+        header = next(csv.reader(f), [])
+
+    new_columns = [col for col in df.columns if col not in header]
+    if not new_columns:
+        df.reindex(columns=header).to_csv(output_path, mode='a', header=False, index=False)
+    else:
+        print(f"New columns {new_columns}, rewriting {output_path}...")
+        columns = header + new_columns
+        tmp_path = output_path + '.tmp'
+        with open(output_path, 'r', encoding='utf-8', newline='') as f, \
+                open(tmp_path, 'w', encoding='utf-8', newline='') as out:
+            reader = csv.reader(f)
+            next(reader)
+            # DataFrame.to_csv와 같은 줄바꿈, 새 컬럼은 빈 값
+            writer = csv.writer(out, lineterminator=os.linesep)
+            writer.writerow(columns)
+            padding = [''] * len(new_columns)
+            for row in reader:
+                writer.writerow(row + padding)
+        df.reindex(columns=columns).to_csv(tmp_path, mode='a', header=False, index=False)
+        os.replace(tmp_path, output_path)
+
 # 메인 실행 코드
 if __name__ == "__main__":
     base_directory = '/Users/guno/Downloads/202403'
+    num_workers = os.cpu_count() or 1  # 1이면 순차 처리
+    # 출력 형식: 'wide' (전체 컬럼 CSV), 'long' (device_id, EQTIME, column, value CSV),
+    # 'parquet' (long 형식, device_id / date 파티션 Parquet 데이터셋, read_long_parquet로 읽음)
+    output_format = 'wide'
+    long_format = output_format in ('long', 'parquet')
+    
+    # True이면 장비별 정렬 run 파일로 나누어 저장 후 병합 (wide CSV 출력에만 적용)
+    streaming = False
+    chunk_size = 50000  # run 파일 하나당 레코드 수
+    # True이면 장비별 마지막으로 처리한 파일명 시간 이후의 파일만 읽어 기존 출력 뒤에 추가
+    # (추가된 행은 장비 내에서는 시간순이지만 파일 전체의 device_id 정렬은 유지되지 않음)
+    incremental = False
+    state_path = os.path.join(os.path.dirname(base_directory), 'exalis_state.json')
+    # 최근 settle_seconds초 안에 수정된 파일은 아직 쓰는 중일 수 있으므로 다음 실행에서 처리
+    settle_seconds = 60
     
-    print("Starting data processing...")
-    df = process_dialysis_files(base_directory)
+    if long_format:
+        # 장비별 long 테이블을 만들자마자 저장 (전체 테이블을 메모리에 모으지 않음)
+        filename = 'exalis_data_parquet' if output_format == 'parquet' else 'exalis_data_long.csv'
+        output_path = os.path.join(os.path.dirname(base_directory), filename)
+        if incremental:
+            # 기존 CSV 뒤에 추가하고, Parquet는 파티션마다 새 파일이 추가되므로 기존 데이터셋은 그대로 둠
+            state = load_state(state_path)
+            print("Starting incremental data processing...")
+        else:
+            state = {}
+            print("Starting data processing...")
+            if output_format == 'parquet' and os.path.exists(output_path):
+                shutil.rmtree(output_path)
+        device_counts, columns, time_range = write_long_dialysis_files(
+            base_directory, output_path, output_format, num_workers, state, append=incremental,
+            min_age=settle_seconds)
+        save_state(state, state_path)
+
+        if incremental and not device_counts:
+            print("No new files")
+        else:
+            print(f"Data saved to {output_path}")
+            print("\nData Summary:")
+            print(f"Total rows: {sum(device_counts.values()):,}")
+            print(f"Number of devices: {len(device_counts)}")
+            print(f"Number of columns: {len(columns)}")
+            if time_range is not None:
+                print(f"Time range: {time_range[0]} ~ {time_range[1]}")
+
+            print("\nRows per device:")
+            for device, count in sorted(device_counts.items(), key=lambda item: item[1], reverse=True):
+                print(f"{device}: {count:,} rows")
+
+            print("\nColumns in the dataset:")
+            for col in sorted(columns):
+                print(f"- {col}")
+    elif incremental:
+        state = load_state(state_path)
+        print("Starting incremental data processing...")
+        df = process_dialysis_files(base_directory, num_workers, state, settle_seconds)
+        
+        if len(df) > 0:
+            output_path = os.path.join(os.path.dirname(base_directory), 'exalis_data_all_devices.csv')
+            append_csv(df, output_path)
+            print(f"Appended {len(df):,} records to {output_path}")
+        else:
+            print("No new files")
+        
+        # 출력 저장 후 상태 갱신
+        save_state(state, state_path)
+    elif streaming:
+        output_path = os.path.join(os.path.dirname(base_directory), 'exalis_data_all_devices.csv')
+        print("Starting data processing (streaming)...")
+        state = {}
+        device_counts, columns = stream_dialysis_files(base_directory, output_path, num_workers, chunk_size,
+                                                       state, settle_seconds)
+        print(f"Data saved to {output_path}")
+        save_state(state, state_path)
+        
+        print("\nData Summary:")
+        print(f"Total records: {sum(device_counts.values()):,}")
+        print(f"Number of devices: {len(device_counts)}")
+        print(f"Number of columns: {len(columns)}")
+        
+        print("\nRecords per device:")
+        for device, count in sorted(device_counts.items(), key=lambda item: item[1], reverse=True):
+            print(f"{device}: {count:,} records")
+            
+        print("\nColumns in the dataset:")
+        for col in columns:
+            print(f"- {col}")
+    else:
+        print("Starting data processing...")
+        # 전체 처리 후에도 상태를 기록해 다음 실행부터 증분 처리 가능
+        state = {}
+        df = process_dialysis_files(base_directory, num_workers, state, settle_seconds)
     
-    output_path = os.path.join(os.path.dirname(base_directory), 'exalis_data_all_devices.csv')
-    print(f"\nSaving data to {output_path}...")
-    df.to_csv(output_path, index=False)
-    print("Data saved successfully!")
+        output_path = os.path.join(os.path.dirname(base_directory), 'exalis_data_all_devices.csv')
+        print(f"\nSaving data to {output_path}...")
+        df.to_csv(output_path, index=False)
+        save_state(state, state_path)
+        print("Data saved successfully!")
     
-    print("\nData Summary:")
-    print(f"Total records: {len(df):,}")
-    print(f"Number of devices: {df['device_id'].nunique()}")
-    print(f"Number of columns: {len(df.columns)}")
-    print(f"Time range: {df['EQTIME'].min()} ~ {df['EQTIME'].max()}")
+        print("\nData Summary:")
+        print(f"Total records: {len(df):,}")
+        print(f"Number of devices: {df['device_id'].nunique()}")
+        print(f"Number of columns: {len(df.columns)}")
+        print(f"Time range: {df['EQTIME'].min()} ~ {df['EQTIME'].max()}")
     
-    print("\nRecords per device:")
-    device_counts = df['device_id'].value_counts()
-    for device, count in device_counts.items():
-        print(f"{device}: {count:,} records")
+        print("\nRecords per device:")
+        device_counts = df['device_id'].value_counts()
+        for device, count in device_counts.items():
+            print(f"{device}: {count:,} records")
         
-    print("\nColumns in the dataset:")
-    for col in df.columns:
-        print(f"- {col}")
\ No newline at end of file
+        print("\nColumns in the dataset:")
+        for col in df.columns:
+            print(f"- {col}")
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from baxter_reader_250116 import label_sessions
+
+def label_sessions_loop(start_array, end_array, first_sess=1):
+    """
+    기존 while 루프 방식 세션 부여 (비교 기준)
+    """
+    idx_array = np.zeros(len(start_array), dtype=np.int64)
+    sess_num = first_sess
+    find_start = True
+    find_pos = 0
+    find_end = len(start_array)
+    curr_start = None
+    curr_end = None
+    complete = 0
+
+    while find_pos != find_end:
+        if find_start:
+            if start_array[find_pos]:
+                if complete == 1:
+                    idx_array[curr_start:curr_end+1] = sess_num
+                    complete = 0
+                    sess_num += 1
+                curr_start = find_pos
+                find_start = False
+            else:
+                if end_array[find_pos]:
+                    curr_end = find_pos
+                find_pos += 1
+        else:
+            if end_array[find_pos]:
+                curr_end = find_pos
+                complete = 1
+                find_start = True
+            find_pos += 1
+
+    if complete == 1:
+        idx_array[curr_start:curr_end+1] = sess_num
+        sess_num += 1
+
+    return idx_array, sess_num
+
+def flags(pattern):
+    """'S' = start, 'E' = end, 'B' = start와 end, '.' = 둘 다 아님"""
+    start = np.array([c in 'SB' for c in pattern], dtype=bool)
+    end = np.array([c in 'EB' for c in pattern], dtype=bool)
+    return start, end
+
+@pytest.mark.parametrize('pattern, expected, next_sess', [
+    # 빈 입력
+    ('', [], 1),
+    # start와 end가 같은 행
+    ('.B.', [0, 1, 0], 2),
+    ('BB', [1, 2], 3),
+    # 세션 진행 중의 start는 무시
+    ('S.S.E', [1, 1, 1, 1, 1], 2),
+    # end가 없는 마지막 start는 버림
+    ('S.E.S..', [1, 1, 1, 0, 0, 0, 0], 2),
+    ('S..', [0, 0, 0], 1),
+    # 첫 start 전의 end는 무시
+    ('E.S.E', [0, 0, 1, 1, 1], 2),
+    # 다음 start 전의 end까지 세션 연장
+    ('SE.E.SE', [1, 1, 1, 1, 0, 2, 2], 3),
+])
+def test_label_sessions_edge_cases(pattern, expected, next_sess):
+    start, end = flags(pattern)
+    labels, sess_num = label_sessions(start, end)
+    assert labels.tolist() == expected
+    assert sess_num == next_sess
+    assert label_sessions_loop(start, end)[0].tolist() == expected
+
+def test_label_sessions_first_sess():
+    start, end = flags('SE.SE')
+    labels, sess_num = label_sessions(start, end, first_sess=7)
+    assert labels.tolist() == [7, 7, 0, 8, 8]
+    assert sess_num == 9
+
+def test_label_sessions_matches_loop():
+    rng = np.random.default_rng(0)
+    for _ in range(20000):
+        n_rows = int(rng.integers(0, 30))
+        start = rng.random(n_rows) < rng.uniform(0, 0.5)
+        end = rng.random(n_rows) < rng.uniform(0, 0.5)
+        first_sess = int(rng.integers(1, 5))
+
+        labels, sess_num = label_sessions(start, end, first_sess)
+        expected, expected_num = label_sessions_loop(start, end, first_sess)
+        assert labels.tolist() == expected.tolist(), (start.tolist(), end.tolist())
+        assert sess_num == expected_num
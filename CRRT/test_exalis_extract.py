@@ -0,0 +1,23 @@
+import pandas as pd
+
+from exalis_extract import read_long_parquet, write_long_parquet
+
+def test_long_parquet_keeps_numeric_device_ids(tmp_path):
+    df = pd.DataFrame({
+        'device_id': ['007', '007', '012'],
+        'EQTIME': pd.to_datetime(['2024-03-01 10:00:00', '2024-03-02 10:00:00', '2024-03-01 11:00:00']),
+        'column': ['Blood Flow', 'Operating Phase', 'Blood Flow'],
+        'value': ['150', 'Treatment', '200'],
+    })
+    # 장비별로 같은 데이터셋에 저장 (write_device_long과 같은 방식)
+    for _, device_df in df.groupby('device_id'):
+        write_long_parquet(device_df, tmp_path / 'exalis')
+
+    table = read_long_parquet(tmp_path / 'exalis').sort_values(['device_id', 'EQTIME'])
+    assert table['device_id'].tolist() == ['007', '007', '012']
+    assert table['date'].tolist() == ['2024-03-01', '2024-03-02', '2024-03-01']
+    assert table['value'].tolist()[::2] == [150.0, 200.0]
+    assert table['value_text'].tolist()[1] == 'Treatment'
+
+    device = read_long_parquet(tmp_path / 'exalis', filters=[('device_id', '==', '007')])
+    assert len(device) == 2
@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+import pytest
+import vitaldb
+
+import vital_to_json
+
+FILE_START = 1700000000  # 2023-11-14 22:13:20 UTC
+
+def write_vital(path, start=FILE_START):
+    """수치(HR), 파형(ECG), 문자열(EVT) 트랙이 있는 .vital 파일 생성"""
+    vf = vitaldb.VitalFile()
+    vf.dtstart = start
+    vf.dtend = start + 60
+    vf.add_track('Dev/HR', [{'dt': start + i, 'val': 60.0 + i} for i in range(0, 60, 2)], unit='bpm')
+    vf.add_track('Dev/ECG', [{'dt': start, 'val': np.arange(100, dtype=np.float32)}], srate=100, unit='mV')
+    vf.add_track('Dev/EVT', [{'dt': start + 10, 'val': 'start'}])
+    vf.to_vital(str(path))
+
+@pytest.fixture
+def vital_dir(tmp_path, monkeypatch):
+    json_dir = tmp_path / 'json'
+    json_dir.mkdir()
+    monkeypatch.setattr(vital_to_json, 'base_path', str(tmp_path))
+    monkeypatch.setattr(vital_to_json, 'json_save_path', str(json_dir))
+    monkeypatch.setattr(vital_to_json, 'output_mode', 'records')
+    write_vital(tmp_path / 'ICU1_123_231114_221320.vital')
+    return tmp_path
+
+def test_track_field_object_and_dict():
+    track = vitaldb.utils.Track('HR', type=2, unit='bpm', recs=[{'dt': 0, 'val': 1.0}])
+    assert vital_to_json.track_field(track, 'unit') == 'bpm'
+    assert vital_to_json.track_field({'type': 2}, 'type') == 2
+    assert vital_to_json.track_field({'type': 2}, 'unit', '') == ''
+
+def test_get_track_catalog_decodes_vital_file(vital_dir):
+    catalog = vital_to_json.get_track_catalog(str(vital_dir / 'ICU1_123_231114_221320.vital'))
+    assert catalog == {
+        'Dev/HR': {'type': 'num', 'unit': 'bpm', 'srate': 0.0},
+        'Dev/ECG': {'type': 'wav', 'unit': 'mV', 'srate': 100.0},
+    }
+
+def test_process_patient_writes_tracks(vital_dir):
+    files = [vital_to_json.parse_vital_filename('ICU1_123_231114_221320.vital')]
+    files[0]['filename'] = 'ICU1_123_231114_221320.vital'
+
+    track_counts = vital_to_json.process_patient('ICU1_123_231114', files)
+    assert track_counts['Dev/HR'] == 30
+    assert 'Dev/EVT' not in track_counts
+
+    with open(vital_dir / 'json' / 'ICU1_123_231114.json', encoding='utf-8') as f:
+        patient = json.load(f)
+    hr = patient['tracks']['Dev/HR']
+    assert hr['type'] == 'num' and hr['unit'] == 'bpm'
+    assert [point['value'] for point in hr['data'][:3]] == [60.0, 62.0, 64.0]
+    assert not vital_to_json.vital_cache
+
+def test_vital_cache_is_bounded(vital_dir, monkeypatch):
+    monkeypatch.setattr(vital_to_json, 'vital_cache_size', 2)
+    paths = [str(vital_dir / f'ICU1_123_231114_22{minute}00.vital') for minute in (20, 21, 22)]
+    for i, path in enumerate(paths):
+        write_vital(path, FILE_START + i * 60)
+
+    decoded = []
+    read_vital = vitaldb.read_vital
+    monkeypatch.setattr(vitaldb, 'read_vital', lambda path: decoded.append(path) or read_vital(path))
+    try:
+        for path in paths + [paths[2]]:
+            vital_to_json.load_vital(path)
+            assert len(vital_to_json.vital_cache) <= 2
+        # 가장 오래된 파일만 밀려남
+        assert decoded == paths
+        assert [key[0] for key in vital_to_json.vital_cache] == paths[1:]
+    finally:
+        vital_to_json.vital_cache.clear()
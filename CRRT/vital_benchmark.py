@@ -0,0 +1,77 @@
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from vital_to_json import format_timestamps, minute_summaries, track_stats
+
+def make_synthetic_tracks(n_tracks=20, hours=24, nan_ratio=0.2, seed=0):
+    """1초 간격 to_numpy 결과와 같은 (시간, 트랙) 배열 생성, 일부 샘플은 NaN"""
+    rng = np.random.default_rng(seed)
+    data = rng.normal(80, 15, size=(hours * 3600, n_tracks))
+    data[rng.random(data.shape) < nan_ratio] = np.nan
+    return data
+
+def export_tracks_legacy(data, start):
+    """기존 트랙별 date_range + strftime + list 통계 방식 (비교용)"""
+    tracks = {}
+    time_index = pd.date_range(start=start, periods=len(data), freq='s')
+    for i in range(data.shape[1]):
+        values = data[:, i]
+        valid_mask = ~np.isnan(values)
+        track_data = [
+            {'timestamp': t.strftime("%Y-%m-%d %H:%M:%S"), 'value': float(v)}
+            for t, v in zip(time_index[valid_mask], values[valid_mask])
+        ]
+        tracks[i] = {
+            'data': track_data,
+            'count': len(track_data),
+            'mean': float(np.mean([d['value'] for d in track_data])),
+            'std': float(np.std([d['value'] for d in track_data]))
+        }
+    return tracks
+
+def export_tracks_vectorized(data, start, with_minute_summary=False):
+    tracks = {}
+    file_start = np.datetime64(start, 's')
+    for i in range(data.shape[1]):
+        valid_index = np.flatnonzero(~np.isnan(data[:, i]))
+        times = file_start + valid_index
+        values = data[valid_index, i]
+        tracks[i] = {
+            'data': [{'timestamp': t, 'value': v} for t, v in zip(format_timestamps(times), values.tolist())],
+            **track_stats(values)
+        }
+        if with_minute_summary:
+            tracks[i]['minute_summary'] = minute_summaries(times, values)
+    return tracks
+
+def benchmark_track_export(n_tracks=20, hours=24):
+    data = make_synthetic_tracks(n_tracks, hours)
+    start = datetime(2024, 1, 1)
+    print(f"Tracks: {n_tracks}, samples per track: {len(data):,}")
+
+    t0 = time.perf_counter()
+    legacy = export_tracks_legacy(data, start)
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    vectorized = export_tracks_vectorized(data, start)
+    t_vectorized = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    export_tracks_vectorized(data, start, with_minute_summary=True)
+    t_summary = time.perf_counter() - t0
+
+    for i in legacy:
+        if (legacy[i]['data'] != vectorized[i]['data'] or
+                not np.isclose(legacy[i]['mean'], vectorized[i]['mean']) or
+                not np.isclose(legacy[i]['std'], vectorized[i]['std'])):
+            print(f"Mismatch for track {i}")
+
+    print(f"{'legacy':>22}: {t_legacy:.2f}s")
+    print(f"{'vectorized':>22}: {t_vectorized:.2f}s ({t_legacy / t_vectorized:.1f}x)")
+    print(f"{'vectorized + summary':>22}: {t_summary:.2f}s")
+
+if __name__ == "__main__":
+    benchmark_track_export()
@@ -4,15 +4,33 @@ import pandas as pd
 from datetime import datetime
 import os
 import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
  
 # .vital 파일 저장되어 있는 경로
 base_path = r'C:\vitaldb'
 
 # JSON 저장할 경로
 json_save_path = r'C:\vitaldb\json_files'
- 
-if not os.path.exists(json_save_path):
-    os.makedirs(json_save_path)
+
+# 출력 형식: 'records' (샘플별 timestamp/value dict), 'columnar' (트랙별 시작 시간 + 간격 + 값 배열)
+output_mode = 'records'
+# columnar 형식에서 값 배열을 별도 파일로 저장 (None, 'npz', 'parquet'), 지정하면 JSON에는 통계만 저장
+sidecar_format = None
+# True이면 트랙별 1분 단위 count/mean/min/max 요약 추가
+minute_summary = False
+
+# 디코딩한 vital 파일(파형 포함)을 메모리에 유지할 최대 개수 (worker 프로세스별)
+# 그룹의 파일 수가 이보다 많으면 트랙 확인과 값 추출에서 파일을 한 번씩 더 디코딩
+vital_cache_size = 4
+
+# 환자 그룹을 동시에 처리할 프로세스 수 (1이면 순차 처리)
+num_workers = os.cpu_count() or 1
+
+# vital 트랙 type 코드 (1: 파형, 2: 수치, 5: 문자열)
+TRACK_TYPES = {1: 'wav', 2: 'num', 5: 'str'}
+# 값 format 코드 (1: float, 2: double, 3: char, 4: byte, 5: short, 6: word, 7: long, 8: dword)
+VALUE_FORMATS = {1, 2, 3, 4, 5, 6, 7, 8}
  
 def parse_vital_filename(filename):
     """vital 파일명에서 정보 추출"""
@@ -31,123 +49,351 @@ def parse_vital_filename(filename):
         }
     return None
  
-def get_numeric_tracks(file_path):
-    """파일에 존재하는 데이터 트랙 찾기"""
+# 처리 중인 환자 그룹에서 디코딩한 VitalFile ((경로, 수정 시간) 기준, 최근 사용 순)
+# 최대 vital_cache_size개만 유지하고, 파일은 자기 그룹 안에서만 쓰이므로 process_patient가 끝나면 비움
+vital_cache = OrderedDict()
+
+def load_vital(file_path):
+    """캐시된 VitalFile 반환, 파일이 수정되었으면 다시 디코딩"""
+    key = (file_path, os.path.getmtime(file_path))
+    if key in vital_cache:
+        vital_cache.move_to_end(key)
+        return vital_cache[key]
+
+    vf = vitaldb.read_vital(file_path)
+    vital_cache[key] = vf
+    while len(vital_cache) > vital_cache_size:
+        vital_cache.popitem(last=False)
+    return vf
+
+def track_field(trk, name, default=None):
+    """트랙 메타데이터 값 (vitaldb 1.7 이후 Track 객체의 속성, 이전 버전 dict의 key)"""
+    if isinstance(trk, dict):
+        return trk.get(name, default)
+    return getattr(trk, name, default)
+
+def get_track_catalog(file_path):
+    """
+    파일에 존재하는 수치 데이터 트랙 찾기
+    트랙 메타데이터(type, fmt)로 문자열 트랙과 레코드가 없는 트랙을 제외하고
+    남은 트랙을 한 번의 to_numpy로 읽어 값이 있는 트랙만 반환
+    {트랙명: {'type', 'unit', 'srate'}}
+    """
     try:
-        vf = vitaldb.read_vital(file_path)
-        all_tracks = vitaldb.vital_trks(file_path)
-        numeric_tracks = []
-
-        for track in all_tracks:
-            try:
-                data = vf.to_numpy([track], 1)
-                if data is not None and len(data) > 0 and np.issubdtype(data.dtype, np.number):
-                    if np.any(~np.isnan(data)):
-                        numeric_tracks.append(track)
-            except:
+        vf = load_vital(file_path)
+
+        candidates = {}
+        for track, trk in vf.trks.items():
+            track_type = TRACK_TYPES.get(track_field(trk, 'type'))
+            if track_type not in ('wav', 'num') or track_field(trk, 'fmt', 1) not in VALUE_FORMATS:
+                continue
+            if not track_field(trk, 'recs'):
                 continue
+            candidates[track] = {
+                'type': track_type,
+                'unit': track_field(trk, 'unit', ''),
+                'srate': float(track_field(trk, 'srate', 0))
+            }
+
+        if not candidates:
+            return {}
+
+        tracks = list(candidates)
+        data = vf.to_numpy(tracks, 1)
+        if data is None or len(data) == 0:
+            return {}
 
-        return numeric_tracks
+        has_value = ~np.isnan(data.astype(float)).all(axis=0)
+        return {track: candidates[track] for track, valid in zip(tracks, has_value) if valid}
     except Exception as e:
         print(f"트랙 확인 중 에러 발생: {e}")
-        return []
+        return {}
  
-vital_files = [f for f in os.listdir(base_path) if f.endswith('.vital')]
- 
-file_info = []
-for file in vital_files:
-    info = parse_vital_filename(file)
-    if info:
-        info['filename'] = file
-        file_info.append(info)
- 
-# 환자별 그룹화
-patient_groups = {}
-for info in file_info:
-    key = f"{info['icu']}_{info['patient_id']}_{info['date']}"
-    if key not in patient_groups:
-        patient_groups[key] = []
-    patient_groups[key].append(info)
- 
-# 각 그룹 내에서 시간순 정렬
-for key in patient_groups:
-    patient_groups[key].sort(key=lambda x: x['datetime'])
- 
-# 각 환자 데이터 처리 및 JSON 저장
-for patient_key, files in patient_groups.items():
+def build_patient_grid(file_arrays, n_tracks, interval=1):
+    """
+    파일별 (환자 시작 시간 기준 offset(초), to_numpy 결과) list를 하나의 (시간, 트랙) 배열로 병합
+    파일 사이 빈 구간은 NaN, 파일이 겹치면 값이 있는 샘플만 덮어씀
+    """
+    length = max((offset // interval + len(data) for offset, data in file_arrays), default=0)
+    grid = np.full((length, n_tracks), np.nan)
+    for offset, data in file_arrays:
+        start = offset // interval
+        block = grid[start:start + len(data)]
+        valid_mask = ~np.isnan(data)
+        block[valid_mask] = data[valid_mask]
+    return grid
+
+def find_gap_runs(values):
+    """NaN 구간을 [시작 index, 길이] list로 반환"""
+    edges = np.diff(np.concatenate(([0], np.isnan(values).astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return [[int(start), int(end - start)] for start, end in zip(starts, ends)]
+
+def track_stats(values):
+    """값 배열의 count/mean/std/min/max"""
+    return {
+        'count': len(values),
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'min': float(values.min()),
+        'max': float(values.max())
+    }
+
+def format_timestamps(times):
+    """datetime64[s] 배열을 'YYYY-mm-dd HH:MM:SS' 문자열 list로 변환"""
+    return np.char.replace(np.datetime_as_string(times, unit='s'), 'T', ' ').tolist()
+
+def minute_summaries(times, values):
+    """
+    1분 단위 count/mean/min/max 요약
+    {'minute': ['YYYY-mm-dd HH:MM', ...], 'count': [...], 'mean': [...], 'min': [...], 'max': [...]}
+    """
+    minutes = times.astype('datetime64[m]')
+    order = np.argsort(minutes, kind='stable')
+    minutes, values = minutes[order], values[order]
+
+    starts = np.flatnonzero(np.r_[True, minutes[1:] != minutes[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    return {
+        'minute': np.char.replace(np.datetime_as_string(minutes[starts], unit='m'), 'T', ' ').tolist(),
+        'count': counts.tolist(),
+        'mean': (np.add.reduceat(values, starts) / counts).tolist(),
+        'min': np.minimum.reduceat(values, starts).tolist(),
+        'max': np.maximum.reduceat(values, starts).tolist()
+    }
+
+def columnar_track(values, times, include_values=True):
+    """
+    트랙 하나의 columnar 표현
+    values: NaN을 제외한 값 배열, gaps: NaN 구간 [시작 index, 길이]
+    (index i의 시간 = start_time + i * interval)
+    """
+    valid_mask = ~np.isnan(values)
+    valid_values = values[valid_mask]
+    track = {'length': len(values), **track_stats(valid_values)}
+    if minute_summary:
+        track['minute_summary'] = minute_summaries(times[valid_mask], valid_values)
+    if include_values:
+        track['gaps'] = find_gap_runs(values)
+        track['values'] = valid_values.tolist()
+    return track
+
+def write_sidecar(grid, tracks, start_time, interval, path_without_ext):
+    """columnar 값 배열을 NPZ 또는 Parquet 파일로 저장, 저장한 파일명 반환"""
+    if sidecar_format == 'npz':
+        path = path_without_ext + '.npz'
+        np.savez_compressed(path, tracks=np.array(tracks), values=grid,
+                            start_time=np.datetime64(start_time, 's'), interval=interval)
+    else:
+        path = path_without_ext + '.parquet'
+        df = pd.DataFrame(grid, columns=tracks)
+        df.insert(0, 'timestamp', pd.Timestamp(start_time) + pd.to_timedelta(np.arange(len(grid)) * interval, unit='s'))
+        df.to_parquet(path, index=False)
+    return os.path.basename(path)
+
+def write_json_header(f, patient_info, indent=None):
+    """
+    patient JSON의 앞부분(환자 정보와 "tracks": { 까지) 저장
+    write_json_track, write_json_footer와 함께 json.dump와 같은 형식으로 트랙을 하나씩 저장
+    """
+    items = [f'{json.dumps(key, ensure_ascii=False)}: {json.dumps(value, ensure_ascii=False)}'
+             for key, value in patient_info.items()]
+    if indent:
+        f.write('{\n' + ''.join(f'  {item},\n' for item in items) + '  "tracks": {')
+    else:
+        f.write('{' + ''.join(f'{item}, ' for item in items) + '"tracks": {')
+
+def write_json_track(f, track_name, track, first, indent=None):
+    """트랙 하나를 "tracks" 객체에 추가"""
+    name = json.dumps(track_name, ensure_ascii=False)
+    if indent:
+        body = json.dumps(track, ensure_ascii=False, indent=indent).replace('\n', '\n    ')
+        f.write(f'{"" if first else ","}\n    {name}: {body}')
+    else:
+        f.write(f'{"" if first else ", "}{name}: {json.dumps(track, ensure_ascii=False)}')
+
+def write_json_footer(f, empty, indent=None):
+    if indent:
+        f.write('}\n}' if empty else '\n  }\n}')
+    else:
+        f.write('}}')
+
+def iter_columnar_tracks(grid, tracks, times, track_catalog):
+    """columnar 형식 트랙을 하나씩 생성"""
+    for i, track in enumerate(tracks):
+        yield track, {
+            'type': track_catalog[track]['type'],
+            'unit': track_catalog[track]['unit'],
+            **columnar_track(grid[:, i], times, include_values=sidecar_format is None)
+        }
+
+def iter_record_tracks(all_track_data, track_catalog):
+    """records 형식 트랙을 하나씩 생성, 생성한 트랙의 배열은 바로 해제"""
+    for track in list(all_track_data):
+        time_arrays, value_arrays = all_track_data.pop(track)
+        if not time_arrays:
+            continue
+
+        times = np.concatenate(time_arrays)
+        values = np.concatenate(value_arrays)
+        track_entry = {
+            'type': track_catalog[track]['type'],
+            'unit': track_catalog[track]['unit'],
+            'data': [
+                {'timestamp': t, 'value': v}
+                for t, v in zip(format_timestamps(times), values.tolist())
+            ],
+            **track_stats(values)
+        }
+        if minute_summary:
+            track_entry['minute_summary'] = minute_summaries(times, values)
+        yield track, track_entry
+
+def process_patient(patient_key, files):
+    """
+    환자 그룹 하나의 vital 파일들을 읽어 JSON으로 저장
+    트랙은 만들어지는 대로 파일에 쓰고 해제, {트랙명: 데이터 포인트 수} 반환
+    """
+    try:
+        return write_patient_json(patient_key, files)
+    finally:
+        # 다른 그룹에서는 쓰이지 않으므로 디코딩한 파일을 worker 메모리에서 해제
+        vital_cache.clear()
+
+def write_patient_json(patient_key, files):
+    """process_patient 본체 (vital_cache 해제는 process_patient에서 처리)"""
     print(f"\n=== patient: {patient_key} ===")
     print(f"연속된 파일 수: {len(files)}")
 
-    # dictionary
-    patient_data = {
+    # 환자 정보 ("tracks"는 트랙별로 따로 저장)
+    patient_info = {
         'patient_id': patient_key,
         'start_time': files[0]['datetime'].strftime("%Y-%m-%d %H:%M:%S"),
         'end_time': files[-1]['datetime'].strftime("%Y-%m-%d %H:%M:%S"),
-        'file_count': len(files),
-        'tracks': {}
+        'file_count': len(files)
     }
 
-    all_numeric_tracks = set()
+    # 파일별 트랙 목록 병합 (먼저 발견된 파일의 메타데이터 사용)
+    track_catalog = {}
     for file_info in files:
         file_path = os.path.join(base_path, file_info['filename'])
-        numeric_tracks = get_numeric_tracks(file_path)
-        all_numeric_tracks.update(numeric_tracks)
+        for track, track_meta in get_track_catalog(file_path).items():
+            track_catalog.setdefault(track, track_meta)
 
-    print(f"발견된 트랙 수: {len(all_numeric_tracks)}")
+    print(f"발견된 트랙 수: {len(track_catalog)}")
 
-    # 각 트랙별로 시계열 데이터 수집
-    for track in all_numeric_tracks:
-        track_data = []
+    # 파일마다 한 번의 to_numpy 호출로 모든 트랙의 시계열 데이터 수집
+    all_numeric_tracks = sorted(track_catalog)
+    all_track_data = {track: ([], []) for track in all_numeric_tracks}  # records 형식: (시간 배열 list, 값 배열 list)
+    file_arrays = []  # columnar 형식: 파일별 (offset(초), 데이터)
 
-        for file_info in files:
-            try:
-                file_path = os.path.join(base_path, file_info['filename'])
-                vf = vitaldb.read_vital(file_path)
-                data = vf.to_numpy([track], 1)
+    for file_info in files:
+        try:
+            file_path = os.path.join(base_path, file_info['filename'])
+            vf = load_vital(file_path)
+            data = vf.to_numpy(all_numeric_tracks, 1)
 
-                if data is not None and len(data) > 0:
-                    time_index = pd.date_range(
-                        start=file_info['datetime'],
-                        periods=len(data),
-                        freq='S'
-                    )
+            if data is not None and len(data) > 0 and output_mode == 'columnar':
+                offset = int((file_info['datetime'] - files[0]['datetime']).total_seconds())
+                file_arrays.append((offset, data.astype(float)))
 
+            elif data is not None and len(data) > 0:
+                data = data.astype(float)
+                file_start = np.datetime64(file_info['datetime'], 's')
+
+                for i, track in enumerate(all_numeric_tracks):
                     # NaN이 아닌 값만 저장
-                    valid_mask = ~np.isnan(data.flatten())
-                    valid_times = time_index[valid_mask]
-                    valid_values = data.flatten()[valid_mask]
-
-                    # 데이터 포인트 추가
-                    track_data.extend([
-                        {
-                            'timestamp': t.strftime("%Y-%m-%d %H:%M:%S"),
-                            'value': float(v)
-                        }
-                        for t, v in zip(valid_times, valid_values)
-                    ])
-
-            except Exception as e:
-                print(f"{track} 처리 중 에러 발생: {e}")
-
-        if track_data:
-            patient_data['tracks'][track] = {
-                'data': track_data,
-                'count': len(track_data),
-                'mean': float(np.mean([d['value'] for d in track_data])),
-                'std': float(np.std([d['value'] for d in track_data]))
-            }
+                    valid_index = np.flatnonzero(~np.isnan(data[:, i]))
+                    if len(valid_index):
+                        all_track_data[track][0].append(file_start + valid_index)
+                        all_track_data[track][1].append(data[valid_index, i])
+
+        except Exception as e:
+            print(f"{file_info['filename']} 처리 중 에러 발생: {e}")
 
-    # JSON 파일로 저장
+    if output_mode == 'columnar' and file_arrays:
+        grid = build_patient_grid(file_arrays, len(all_numeric_tracks))
+        del file_arrays
+        patient_info['interval'] = 1
+
+        has_value = ~np.isnan(grid).all(axis=0)
+        tracks = [track for track, valid in zip(all_numeric_tracks, has_value) if valid]
+        grid = grid[:, has_value]
+
+        if sidecar_format is not None:
+            patient_info['sidecar'] = write_sidecar(grid, tracks, files[0]['datetime'], 1,
+                                                    os.path.join(json_save_path, patient_key))
+
+        times = np.datetime64(files[0]['datetime'], 's') + np.arange(len(grid))
+        track_items = iter_columnar_tracks(grid, tracks, times, track_catalog)
+    else:
+        track_items = iter_record_tracks(all_track_data, track_catalog)
+
+    # JSON 파일로 저장 (트랙 단위로 저장해 트랙 하나 분량만 메모리에 유지)
+    # columnar 형식은 값 배열이 길어 들여쓰기 없이 저장
     json_filename = os.path.join(json_save_path, f"{patient_key}.json")
+    indent = 2 if output_mode == 'records' else None
+    track_counts = {}
     try:
-        with open(json_filename, 'w', encoding='utf-8') as f:
-            json.dump(patient_data, f, ensure_ascii=False, indent=2)
+        with open(json_filename + '.tmp', 'w', encoding='utf-8') as f:
+            write_json_header(f, patient_info, indent)
+            for track, track_entry in track_items:
+                write_json_track(f, track, track_entry, not track_counts, indent)
+                track_counts[track] = track_entry['count']
+            write_json_footer(f, not track_counts, indent)
+        os.replace(json_filename + '.tmp', json_filename)
         print(f"JSON 저장 완료: {json_filename}")
 
-        print(f"저장된 트랙 수: {len(patient_data['tracks'])}")
-        for track_name, track_info in patient_data['tracks'].items():
-            print(f"- {track_name}: {track_info['count']} 데이터 포인트")
+        print(f"저장된 트랙 수: {len(track_counts)}")
+        for track_name, count in track_counts.items():
+            print(f"- {track_name}: {count} 데이터 포인트")
 
     except Exception as e:
         print(f"JSON 저장 중 에러 발생: {e}")
- 
+
+    return track_counts
+
+def main():
+    if not os.path.exists(json_save_path):
+        os.makedirs(json_save_path)
+
+    vital_files = [f for f in os.listdir(base_path) if f.endswith('.vital')]
+
+    file_info = []
+    for file in vital_files:
+        info = parse_vital_filename(file)
+        if info:
+            info['filename'] = file
+            file_info.append(info)
+
+    # 환자별 그룹화
+    patient_groups = {}
+    for info in file_info:
+        key = f"{info['icu']}_{info['patient_id']}_{info['date']}"
+        if key not in patient_groups:
+            patient_groups[key] = []
+        patient_groups[key].append(info)
+
+    # 각 그룹 내에서 시간순 정렬
+    for key in patient_groups:
+        patient_groups[key].sort(key=lambda x: x['datetime'])
+
+    # 각 환자 데이터 처리 및 JSON 저장
+    if num_workers <= 1:
+        for patient_key, files in patient_groups.items():
+            process_patient(patient_key, files)
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = {executor.submit(process_patient, patient_key, files): patient_key
+                       for patient_key, files in patient_groups.items()}
+            for n_done, future in enumerate(as_completed(futures), 1):
+                patient_key = futures[future]
+                try:
+                    future.result()
+                    print(f"[{n_done}/{len(futures)}] {patient_key} 완료")
+                except Exception as e:
+                    print(f"{patient_key} 처리 중 에러 발생: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -1,209 +1,437 @@
 import os
 import re
+import json
+import time
+import base64
 import wfdb
-import pandas as pd
+import numpy as np
 import fitz  # PyMuPDF
-from xml.etree.ElementTree import Element, SubElement, tostring, ElementTree
-from xml.dom.minidom import parseString
+from xml.etree.ElementTree import Element, SubElement
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from tqdm import tqdm
 
-def process_pdf_files(pdf_dir, xml_dir):
-    pdf_files = [f for f in os.listdir(pdf_dir) if f.endswith('.pdf')]
-    for filename in tqdm(pdf_files, desc="Processing PDF Files"):
-        pdf_path = os.path.join(pdf_dir, filename)
-        pdf_doc = fitz.open(pdf_path)
-        print(f"Processing file: {filename}, Total Pages: {pdf_doc.page_count}")
-
-        page = pdf_doc.load_page(0)
-        extracted_text = page.get_text()
-
-        # XML 루트 요소 생성
-        root = Element('HolterReport')
-
-        # Parsing the text
-        # patient_name = re.findall(r"HOLTER REPORT\n(.+)\nPatient Name:", extracted_text)[0]
-        patient_id = re.findall(r"Patient Name:\n(\d+)\nID:", extracted_text)[0]
-        hookup_date = re.findall(r"Medications:\n(\d+-\w+-\d+)\nHookup Date:", extracted_text)[0]
-        hookup_time = re.findall(r"Hookup Date:\n(\d+:\d+:\d+)\nHookup Time:", extracted_text)[0]
-        duration = re.findall(r"Hookup Time:\n(\d+:\d+:\d+)\nDuration:", extracted_text)[0]
-
-        # Parsing General section
-        general_section = re.search(r"General\n(.+?)Heart Rates", extracted_text, re.DOTALL).group(1)
-        qrs_complexes = re.search(r"(\d+) QRS complexes", general_section).group(1)
-        ventricular_beats = re.search(r"(\d+) Ventricular beats", general_section).group(1)
-        supraventricular_beats = re.search(r"(\d+) Supraventricular beats", general_section).group(1)
-        noise_percentage_match = re.search(r"(<\s*\d+|\d+) % of total time classified as noise", general_section)
-        if noise_percentage_match:
-            # "<" 기호와 숫자, 또는 숫자만 추출
-            noise_percentage = noise_percentage_match.group(1)
-        else:
-            noise_percentage = "0"  # 일치하는 것이 없는 경우 기본값 설정
-
-        # Constructing the XML
-        patient_info = SubElement(root, 'PatientInfo')
-        #SubElement(patient_info, 'Name').text = patient_name
-        SubElement(patient_info, 'PID').text = patient_id
-        SubElement(patient_info, 'HookupDate').text = hookup_date
-        SubElement(patient_info, 'HookupTime').text = hookup_time
-        SubElement(patient_info, 'Duration').text = duration
-
-        # General
-        general = SubElement(root, 'General')
-        SubElement(general, 'QRScomplexes').text = qrs_complexes
-        SubElement(general, 'VentricularBeats').text = ventricular_beats
-        SubElement(general, 'SupraventricularBeats').text = supraventricular_beats
-        SubElement(general, 'NoisePercentage').text = noise_percentage
-
-
-        # Heart Rates section
-        heart_rates = SubElement(root, 'HeartRates')
-        patterns_hr = [
-            (r"(\d+) Minimum at ([\d:]+ \d+-\w+)", 'MinimumRate', 'Timestamp'),
-            (r"(\d+) Average", 'AverageRate', None),
-            (r"(\d+) Maximum at ([\d:]+ \d+-\w+)", 'MaximumRate', 'Timestamp'),
-            (r"(\d+) Beats in tachycardia \(>=?100 bpm\), (\d+)% total", 'TachycardiaBeats', 'TachycardiaPercentage'),
-            (r"(\d+) Beats in bradycardia \(<=?60 bpm\), (\d+)% total", 'BradycardiaBeats', 'BradycardiaPercentage'),
-        ]
-
-        for pattern, main_tag, sub_tag in patterns_hr:
-            match = re.search(pattern, extracted_text)
-            if match:
-                if sub_tag:
-                    element = SubElement(heart_rates, main_tag)
-                    SubElement(element, sub_tag).text = match.group(2)
-                    element.text = match.group(1)  # Main value
-                else:
-                    SubElement(heart_rates, main_tag).text = match.group(1)
-                    
-        max_rr_match = re.search(r"(\d+\.\d+) Seconds Max R-R at ([\d:]+ \d+-\w+)", extracted_text)
-        if max_rr_match:
-            max_rr = SubElement(heart_rates, 'SecondsMaxRR')
-            SubElement(max_rr, 'Seconds').text = max_rr_match.group(1)
-            SubElement(max_rr, 'Timestamp').text = max_rr_match.group(2)
-
-                            
-        # Ventriculars section extraction
-        ventriculars_match = re.search(r"Ventriculars \(V, F, E, I\)\n([\s\S]+?)\nSupraventriculars \(S, J, A\)", extracted_text)
-        if ventriculars_match:
-            ventriculars_section = ventriculars_match.group(1)
-        else:
-            ventriculars_section = ""
-
-        # Supraventriculars section extraction
-        supraventriculars_match = re.search(r"Supraventriculars \(S, J, A\)\n([\s\S]+?)Interpretation", extracted_text)
-        if supraventriculars_match:
-            supraventriculars_section = supraventriculars_match.group(1)
+# 리포트 문법 (import 시 하나의 정규식으로 컴파일해 페이지 텍스트를 한 번만 훑음)
+# 구간: (이름, 시작 표시, 끝 표시), 처음 나온 시작 표시 다음 줄부터 그 뒤 처음 나온 자기 끝 표시까지
+# 끝 표시는 자기 구간만 닫고, 끝 표시가 없으면 구간 값은 쓰지 않음
+# 줄바꿈은 lookahead로 두어 바로 다음 줄의 구간 표시("\nSupraventriculars")를 가리지 않게 함
+REPORT_SECTION_RULES = [
+    ('General', r"General(?=\n)", r"Heart Rates"),
+    ('Ventriculars', r"Ventriculars \(V, F, E, I\)(?=\n)", r"\n(?=Supraventriculars \(S, J, A\))"),
+    ('Supraventriculars', r"Supraventriculars \(S, J, A\)(?=\n)", r"Interpretation"),
+]
+
+# 필드: (XML 섹션, 적용 구간, 정규식, group별 XML 태그, 필수 여부)
+# 적용 구간이 None이면 페이지 전체에서 처음 나오는 값 사용
+# 태그: 'Tag' -> <Tag>값</Tag>, ('Parent', 'Child') -> <Parent><Child>값</Child></Parent>,
+#       ('', 'Child') -> 바로 앞에 만든 섹션 하위 요소의 <Child>값</Child>
+# 다음 필드의 라벨과 겹치는 부분, 끝의 시각 값은 lookahead로 두어 한 번의 scan에서 모두 찾을 수 있게 함
+# 구간 필드 정규식은 구간 끝을 넘지 않도록 구간이 닫힐 때 끝 위치까지만 다시 match
+ECTOPIC_FIELDS = [
+    (r"(\d+) Isolated", ['Isolated']),
+    (r"(\d+) Couplets", ['Couplets']),
+    (r"(\d+) Bigeminal cycles", ['BigeminalCycles']),
+    (r"(\d+) Runs totaling (\d+) beats", ['Runs', ('RunsDetails', 'TotalBeats')]),
+    (r"(\d+) Beats longest run (\d+) bpm (?=([\d:]+ \d+-\w+))", [('LongestRun', 'Beats'), ('LongestRun', 'BPM'), ('LongestRun', 'Timestamp')]),
+    (r"(\d+) Beats fastest run (\d+) bpm (?=([\d:]+ \d+-\w+))", [('FastestRun', 'Beats'), ('FastestRun', 'BPM'), ('FastestRun', 'Timestamp')]),
+]
+
+REPORT_FIELDS = [
+    # ('PatientInfo', None, r"HOLTER REPORT\n(.+)\n(?=Patient Name:)", ['Name'], True),
+    ('PatientInfo', None, r"Patient Name:\n(\d+)\n(?=ID:)", ['PID'], True),
+    ('PatientInfo', None, r"Medications:\n(\d+-\w+-\d+)\n(?=Hookup Date:)", ['HookupDate'], True),
+    ('PatientInfo', None, r"Hookup Date:\n(\d+:\d+:\d+)\n(?=Hookup Time:)", ['HookupTime'], True),
+    ('PatientInfo', None, r"Hookup Time:\n(\d+:\d+:\d+)\n(?=Duration:)", ['Duration'], True),
+
+    ('General', 'General', r"(\d+) QRS complexes", ['QRScomplexes'], True),
+    ('General', 'General', r"(\d+) Ventricular beats", ['VentricularBeats'], True),
+    ('General', 'General', r"(\d+) Supraventricular beats", ['SupraventricularBeats'], True),
+    # "<" 기호와 숫자, 또는 숫자만 추출
+    ('General', 'General', r"(<\s*\d+|\d+) % of total time classified as noise", ['NoisePercentage'], False),
+
+    ('HeartRates', None, r"(\d+) Minimum at (?=([\d:]+ \d+-\w+))", ['MinimumRate', ('', 'Timestamp')], False),
+    ('HeartRates', None, r"(\d+) Average", ['AverageRate'], False),
+    ('HeartRates', None, r"(\d+) Maximum at (?=([\d:]+ \d+-\w+))", ['MaximumRate', ('', 'Timestamp')], False),
+    ('HeartRates', None, r"(\d+) Beats in tachycardia \(>=?100 bpm\), (\d+)% total", ['TachycardiaBeats', ('', 'TachycardiaPercentage')], False),
+    ('HeartRates', None, r"(\d+) Beats in bradycardia \(<=?60 bpm\), (\d+)% total", ['BradycardiaBeats', ('', 'BradycardiaPercentage')], False),
+    ('HeartRates', None, r"(\d+\.\d+) Seconds Max R-R at (?=([\d:]+ \d+-\w+))", [('SecondsMaxRR', 'Seconds'), ('', 'Timestamp')], False),
+] + [
+    (section, section, pattern, tags, False)
+    for section in ('Ventriculars', 'Supraventriculars')
+    for pattern, tags in ECTOPIC_FIELDS
+]
+
+# 값이 없을 때 기본값을 쓰는 필드
+REPORT_DEFAULTS = {'NoisePercentage': '0'}
+
+REPORT_SECTIONS = ['PatientInfo', 'General', 'HeartRates', 'Ventriculars', 'Supraventriculars']
+
+# 같은 정규식을 쓰는 필드(Ventriculars / Supraventriculars)는 group 하나를 공유하고 구간으로 구분
+# 필드 / 구간 표시는 대문자, '<', 줄바꿈, 연속된 숫자의 첫 글자로 시작하므로 그 위치에서만 문법 전체를 검사
+REPORT_FIELD_PATTERNS = list(dict.fromkeys(field[2] for field in REPORT_FIELDS))
+REPORT_PATTERN = re.compile(r"(?=[A-Z<\n]|(?<!\d)\d)(?:" + '|'.join(
+    [f"(?P<o{i}>{rule[1]})|(?P<c{i}>{rule[2]})" for i, rule in enumerate(REPORT_SECTION_RULES)] +
+    [f"(?P<f{i}>{pattern})" for i, pattern in enumerate(REPORT_FIELD_PATTERNS)]
+) + ')')
+# 정규식별 (컴파일한 정규식, 첫 번째 값 group 위치, group 수, {적용 구간: 필드 index})
+REPORT_FIELD_GROUPS = [
+    (re.compile(pattern), REPORT_PATTERN.groupindex[f"f{i}"], re.compile(pattern).groups,
+     {field[1]: index for index, field in enumerate(REPORT_FIELDS) if field[2] == pattern})
+    for i, pattern in enumerate(REPORT_FIELD_PATTERNS)
+]
+
+def scan_report_text(text):
+    """
+    페이지 텍스트를 한 번 훑어 {필드 index: 값 tuple} 반환
+    구간 밖 필드는 처음 나온 값, 구간 필드는 구간이 닫힐 때 구간 안에서 처음 나온 값
+    """
+    values = {}
+    sections = {}  # 열린 구간: 이름 -> (내용 시작 위치, [(필드 index, 정규식 index, 위치)])
+    closed = set()
+    for match in REPORT_PATTERN.finditer(text):
+        name = match.lastgroup
+        kind, index = name[0], int(name[1:])
+        if kind == 'o':
+            section = REPORT_SECTION_RULES[index][0]
+            sections.setdefault(section, (match.end(name) + 1, []))
+        elif kind == 'c':
+            section = REPORT_SECTION_RULES[index][0]
+            # 내용이 한 글자 이상일 때만 닫음
+            if section in closed or section not in sections or match.start(name) <= sections[section][0]:
+                continue
+            closed.add(section)
+            for field_index, pattern_index, pos in sections[section][1]:
+                if field_index not in values:
+                    field = REPORT_FIELD_GROUPS[pattern_index][0].match(text, pos, match.start(name))
+                    if field is not None:
+                        values[field_index] = field.groups()
         else:
-            supraventriculars_section = ""
-
-        # Regex patterns for Ventriculars and Supraventriculars
-        ventriculars_patterns = [
-            (r"(\d+) Isolated", ['Isolated']),
-            (r"(\d+) Couplets", ['Couplets']),
-            (r"(\d+) Bigeminal cycles", ['BigeminalCycles']),
-            (r"(\d+) Runs totaling (\d+) beats", ['Runs', ('RunsDetails', 'TotalBeats')]),
-            (r"(\d+) Beats longest run (\d+) bpm ([\d:]+ \d+-\w+)", [('LongestRun', 'Beats'), ('LongestRun', 'BPM'), ('LongestRun', 'Timestamp')]),
-            (r"(\d+) Beats fastest run (\d+) bpm ([\d:]+ \d+-\w+)", [('FastestRun', 'Beats'), ('FastestRun', 'BPM'), ('FastestRun', 'Timestamp')])
-        ]
-
-        supraventriculars_patterns = [
-            (r"(\d+) Isolated", ['Isolated']),
-            (r"(\d+) Couplets", ['Couplets']),
-            (r"(\d+) Bigeminal cycles", ['BigeminalCycles']),
-            (r"(\d+) Runs totaling (\d+) beats", ['Runs', ('RunsDetails', 'TotalBeats')]),
-            (r"(\d+) Beats longest run (\d+) bpm ([\d:]+ \d+-\w+)", [('LongestRun', 'Beats'), ('LongestRun', 'BPM'), ('LongestRun', 'Timestamp')]),
-            (r"(\d+) Beats fastest run (\d+) bpm ([\d:]+ \d+-\w+)", [('FastestRun', 'Beats'), ('FastestRun', 'BPM'), ('FastestRun', 'Timestamp')])
-        ]
-
-        # Ventriculars section to add xml
-        ventriculars_xml = ET.SubElement(root, "Ventriculars")
-        for pattern, tags in ventriculars_patterns:
-            match = re.search(pattern, ventriculars_section)
-            if match:
-                for tag_index, tag in enumerate(tags):
-                    if isinstance(tag, tuple):  
-                        parent_tag = ET.SubElement(ventriculars_xml, tag[0])
-                        ET.SubElement(parent_tag, tag[1]).text = match.group(tag_index + 1)
-                    else:
-                        ET.SubElement(ventriculars_xml, tag).text = match.group(tag_index + 1)
-
-        # Supraventriculars section to add xml
-        supraventriculars_xml = ET.SubElement(root, "Supraventriculars")
-        for pattern, tags in supraventriculars_patterns:
-            match = re.search(pattern, supraventriculars_section)
-            if match:
-                for tag_index, tag in enumerate(tags):
-                    if isinstance(tag, tuple):  
-                        parent_tag = ET.SubElement(supraventriculars_xml, tag[0])
-                        ET.SubElement(parent_tag, tag[1]).text = match.group(tag_index + 1)
-                    else:
-                        ET.SubElement(supraventriculars_xml, tag).text = match.group(tag_index + 1)
-
-        xml_str = tostring(root, 'utf-8')
-        parsed_str = parseString(xml_str)
-        pretty_xml_str = parsed_str.toprettyxml(indent="   ")
-
-        xml_filename = os.path.splitext(filename)[0] + '.xml'
-        xml_file_path = os.path.join(xml_dir, xml_filename)
-
-        with open(xml_file_path, "w") as xml_file:
-            xml_file.write(pretty_xml_str)
-
-        print(f"Processed {filename}, Saved XML file: {xml_file_path}")
-
-def add_record_data_to_xml(record_dir, xml_dir):
+            pattern, start, n_groups, fields = REPORT_FIELD_GROUPS[index]
+            field_index = fields.get(None)
+            if field_index is not None:
+                if field_index not in values:
+                    values[field_index] = match.groups()[start:start + n_groups]
+                continue
+            for section, (content_start, candidates) in sections.items():
+                if section not in closed and section in fields and match.start(name) >= content_start:
+                    candidates.append((fields[section], index, match.start(name)))
+    return values
+
+def build_report_xml(values):
+    """scan_report_text 결과로 HolterReport XML 요소 생성, 필수 필드가 없으면 ValueError 발생"""
+    root = Element('HolterReport')
+    sections = {name: SubElement(root, name) for name in REPORT_SECTIONS}
+
+    for index, (section, scope, pattern, tags, required) in enumerate(REPORT_FIELDS):
+        groups = values.get(index)
+        if groups is None:
+            if required:
+                raise ValueError(f"{tags[0]} not found in report text")
+            if tags[0] not in REPORT_DEFAULTS:
+                continue
+            groups = (REPORT_DEFAULTS[tags[0]],)
+
+        parent = sections[section]
+        element = None
+        for tag, value in zip(tags, groups):
+            if isinstance(tag, str):
+                element = SubElement(parent, tag)
+                element.text = value
+            elif tag[0]:
+                element = SubElement(parent, tag[0])
+                SubElement(element, tag[1]).text = value
+            else:
+                SubElement(element, tag[1]).text = value
+
+    return root
+
+def parse_holter_report(pdf_path):
+    """Holter 리포트 PDF 첫 페이지를 읽어 HolterReport XML 요소로 변환"""
+    filename = os.path.basename(pdf_path)
+    pdf_doc = fitz.open(pdf_path)
+    print(f"Processing file: {filename}, Total Pages: {pdf_doc.page_count}")
+
+    page = pdf_doc.load_page(0)
+    extracted_text = page.get_text()
+
+    root = build_report_xml(scan_report_text(extracted_text))
+
+    # minidom 없이 바로 들여쓰기
+    ET.indent(root, space="   ")
+    return root
+
+def convert_holter_file(pdf_path, xml_file_path, record_path=None, waveform_format='text', chunk_size=65536):
+    """
+    PDF 리포트 하나(와 wfdb 레코드)를 XML로 저장
+    실패해도 예외를 올리지 않고 {'file', 'xml', 'seconds'} 결과에 'error', 'message'를 담아 반환
+    파형 저장만 실패하면 리포트만 담은 XML을 저장하고 결과에 'report_only': True 추가
+    """
+    start = time.perf_counter()
+    result = {'file': os.path.basename(pdf_path), 'xml': xml_file_path}
+    try:
+        root = parse_holter_report(pdf_path)
+        try:
+            write_holter_xml(root, xml_file_path, record_path, waveform_format, chunk_size)
+        except Exception:
+            if record_path is None:
+                raise
+            # 기존 두 단계 처리(process_pdf_files → add_record_data_to_xml)처럼 리포트는 남김
+            write_holter_xml(root, xml_file_path)
+            result['report_only'] = True
+            raise
+    except Exception as e:
+        result['error'] = type(e).__name__
+        result['message'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def failed_task_result(task, error):
+    """worker 프로세스에서 결과를 받지 못한 작업의 실패 결과 (처리 시간 없음)"""
+    pdf_path, xml_file_path = task[:2]
+    return {'file': os.path.basename(pdf_path), 'xml': xml_file_path,
+            'error': type(error).__name__, 'message': str(error)}
+
+def convert_holter_file_isolated(task):
+    """convert_holter_file을 작업 하나만의 프로세스에서 실행 (프로세스가 죽어도 이 작업만 실패)"""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        try:
+            return executor.submit(convert_holter_file, *task).result()
+        except Exception as e:
+            return failed_task_result(task, e)
+
+def run_holter_batch(tasks, num_workers=1, desc="Processing PDF Files"):
+    """
+    convert_holter_file 인자 tuple list를 처리하고 파일별 결과 list 반환
+    num_workers > 1이면 프로세스 풀에서 병렬 처리
+    worker 프로세스가 죽으면(PDF 라이브러리 segfault 등) 풀에 남은 파일을 파일마다 별도 프로세스에서 다시 처리해
+    죽은 파일만 실패 결과로 기록
+    """
+    results = []
+    start = time.perf_counter()
+    if num_workers <= 1:
+        for task in tqdm(tasks, desc=desc):
+            results.append(convert_holter_file(*task))
+    else:
+        retry_tasks = []
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = {executor.submit(convert_holter_file, *task): task for task in tasks}
+            for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+                try:
+                    results.append(future.result())
+                except BrokenProcessPool:
+                    # 풀이 깨지면 처리 중이거나 대기 중인 파일이 모두 실패하므로 어느 파일 때문인지 알 수 없음
+                    retry_tasks.append(futures[future])
+                except Exception as e:
+                    results.append(failed_task_result(futures[future], e))
+
+        if retry_tasks:
+            print(f"\nWorker process terminated, retrying {len(retry_tasks)} files in separate processes")
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                results.extend(tqdm(executor.map(convert_holter_file_isolated, retry_tasks),
+                                    total=len(retry_tasks), desc=desc))
+
+    for result in results:
+        if 'error' not in result:
+            print(f"Processed {result['file']} in {result['seconds']:.2f}s, Saved XML file: {result['xml']}")
+
+    failures = [result for result in results if 'error' in result]
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(results) - len(failures)}/{len(results)} files processed in {elapsed:.1f}s")
+    timed = [result for result in results if 'seconds' in result]
+    if timed:
+        slowest = max(timed, key=lambda result: result['seconds'])
+        print(f"Average {sum(result['seconds'] for result in timed) / len(timed):.2f}s per file, "
+              f"slowest {slowest['file']} ({slowest['seconds']:.2f}s)")
+    for failure in failures:
+        report_only = " (report saved without waveform)" if failure.get('report_only') else ""
+        print(f"Failed {failure['file']}: {failure['error']}: {failure['message']}{report_only}")
+
+    return results
+
+def process_pdf_files(pdf_dir, xml_dir, num_workers=1):
+    pdf_files = [f for f in os.listdir(pdf_dir) if f.endswith('.pdf')]
+    tasks = [(os.path.join(pdf_dir, filename), os.path.join(xml_dir, os.path.splitext(filename)[0] + '.xml'))
+             for filename in pdf_files]
+    return run_holter_batch(tasks, num_workers, "Processing PDF Files")
+
+def format_attributes(attributes):
+    """XML 속성 문자열 (ElementTree와 같은 escape)"""
+    return ''.join(f' {name}="{escape(str(value), {chr(34): "&quot;"})}"' for name, value in attributes.items())
+
+def lead_attributes(header, channel):
+    """디지털 값을 물리 값으로 바꾸는 데 필요한 리드 정보 (physical = (digital - baseline) / gain)"""
+    return {
+        'lead': str(channel + 1),
+        'name': header.sig_name[channel],
+        'units': header.units[channel],
+        'gain': repr(float(header.adc_gain[channel])),
+        'baseline': str(int(header.baseline[channel])),
+    }
+
+def digital_dtype(header):
+    """
+    디지털 신호를 값 손실 없이 담을 정수 타입 (numpy dtype, 비트 수)
+    저장 format이 24 / 32이거나 ADC 해상도가 16비트를 넘으면 int32, 나머지(8, 16, 212 등)는 int16
+    """
+    wide = (any(str(fmt) in ('24', '32') for fmt in (header.fmt or [])) or
+            any(res is not None and res > 16 for res in (header.adc_res or [])))
+    return ('<i4', 32) if wide else ('<i2', 16)
+
+def iter_windows(sig_len, window_size):
+    """(sampfrom, sampto) 구간을 window_size 샘플씩 생성"""
+    for sampfrom in range(0, sig_len, window_size):
+        yield sampfrom, min(sampfrom + window_size, sig_len)
+
+def write_text_waveform(out, record_path, header, window_size):
+    """리드별로 window_size 샘플씩 물리 값을 읽어 ','로 이은 문자열로 저장"""
+    out.write('<data>')
+    for channel in range(header.n_sig):
+        out.write(f'\n  <WaveformData lead="{channel + 1}">')
+        for sampfrom, sampto in iter_windows(header.sig_len, window_size):
+            window = wfdb.rdrecord(record_path, sampfrom=sampfrom, sampto=sampto, channels=[channel])
+            if sampfrom > 0:
+                out.write(',')
+            out.write(','.join(map(str, window.p_signal[:, 0].tolist())))
+        out.write('</WaveformData>')
+    out.write('\n</data>')
+
+def write_base64_waveform(out, record_path, header, window_size):
+    """
+    리드별 디지털 신호를 window_size 샘플씩 읽어 base64 인코딩한 int16 / int32(little-endian, digital_dtype 참고)
+    블록으로 저장, 정수 타입은 encoding 속성에 기록 (base64-int16le, base64-int32le)
+    <WaveformData lead gain baseline ...><Chunk offset samples>...</Chunk></WaveformData>
+    """
+    dtype, bits = digital_dtype(header)
+    out.write(f'<data{format_attributes({"encoding": f"base64-int{bits}le", "fs": header.fs, "samples": header.sig_len})}>')
+    for channel in range(header.n_sig):
+        out.write(f'<WaveformData{format_attributes(lead_attributes(header, channel))}>')
+        for sampfrom, sampto in iter_windows(header.sig_len, window_size):
+            window = wfdb.rdrecord(record_path, sampfrom=sampfrom, sampto=sampto, channels=[channel],
+                                   physical=False, return_res=bits)
+            block = window.d_signal[:, 0].astype(dtype)
+            out.write(f'<Chunk offset="{sampfrom}" samples="{len(block)}">')
+            out.write(base64.b64encode(block.tobytes()).decode('ascii'))
+            out.write('</Chunk>')
+        out.write('</WaveformData>')
+    out.write('</data>')
+
+def write_npy_waveform(out, record_path, header, window_size, npy_path):
+    """
+    디지털 신호를 window_size 샘플씩 (샘플, 리드) NPY 파일에 쓰고 XML에는 파일 경로와 리드 정보만 기록
+    정수 타입은 digital_dtype으로 정하고 encoding 속성에 기록 (npy-int16, npy-int32)
+    """
+    dtype, bits = digital_dtype(header)
+    signals = np.lib.format.open_memmap(npy_path, mode='w+', dtype=dtype, shape=(header.sig_len, header.n_sig))
+    for sampfrom, sampto in iter_windows(header.sig_len, window_size):
+        window = wfdb.rdrecord(record_path, sampfrom=sampfrom, sampto=sampto, physical=False, return_res=bits)
+        signals[sampfrom:sampto] = window.d_signal
+    signals.flush()
+    del signals
+
+    out.write(f'<data{format_attributes({"encoding": f"npy-int{bits}", "fs": header.fs, "samples": header.sig_len, "file": os.path.basename(npy_path)})}>')
+    for channel in range(header.n_sig):
+        out.write(f'<WaveformData{format_attributes(lead_attributes(header, channel))} />')
+    out.write('</data>')
+
+def add_record_data_to_xml(record_dir, xml_dir, waveform_format='text', chunk_size=65536):
+    """
+    wfdb 레코드의 신호를 같은 이름의 XML에 추가
+    레코드를 chunk_size 샘플 구간(sampfrom/sampto)씩 읽어 바로 파일에 쓰므로 기록 길이와 관계없이 메모리 사용량 일정
+    waveform_format: 'text' (물리 값을 ','로 이은 문자열), 'base64' (chunk별 base64 int16 / int32 블록),
+                     'npy' (XML 옆 NPY 파일에 저장하고 XML에서 참조)
+    """
     record_files = [f for f in os.listdir(record_dir) if f.endswith('.hea')]
     for record_file in tqdm(record_files, desc="Adding Record Data to XML"):
         record_path = os.path.join(record_dir, record_file[:-4])  # Remove .hea extension
-        record = wfdb.rdrecord(record_path)
-        df = pd.DataFrame(record.p_signal, columns=record.sig_name)
-        df_transposed = df.T
-
-        # Prepare XML elements
-        data_element = ET.Element('data')
-        for channel, values in enumerate(df_transposed.values, start=1):
-            signal_data = ','.join(map(str, values))
-            wave_form_data = ET.SubElement(data_element, 'WaveformData', lead=str(channel))
-            wave_form_data.text = signal_data
-
-        # Convert to string and add newline for formatting
-        xml_string = ET.tostring(data_element, 'utf-8')
-        pretty_xml_str = parseString(xml_string).toprettyxml(indent="  ")
-
-        # Adjust formatting to add newline after <data> and before each <WaveformData>
-        pretty_xml_str = pretty_xml_str.replace('><WaveformData', '>\n<WaveformData')
-        pretty_xml_str = pretty_xml_str.replace('</WaveformData><', '</WaveformData>\n<')
-
         xml_filename = os.path.splitext(record_file)[0] + '.xml'
         xml_file_path = os.path.join(xml_dir, xml_filename)
 
-        if os.path.exists(xml_file_path):
-            # Load existing XML and append new data
-            tree = ET.parse(xml_file_path)
-            root = tree.getroot()
-
-            # Parse the newly created XML string and append it
-            new_data_element = ET.fromstring(pretty_xml_str)
-            root.append(new_data_element)
-
-            # Save back to file
-            tree.write(xml_file_path, encoding='utf-8', xml_declaration=True)
-            print(f"Added record data to {xml_file_path}")
-        else:
+        if not os.path.exists(xml_file_path):
             print(f"Warning: {xml_file_path} does not exist.")
+            continue
+
+        # 기존 리포트 XML(작은 파일)만 읽고 파형은 바로 이어서 저장
+        root = ET.parse(xml_file_path).getroot()
+        write_holter_xml(root, xml_file_path, record_path, waveform_format, chunk_size)
+        print(f"Added record data to {xml_file_path}")
+
+def write_holter_xml(root, xml_file_path, record_path=None, waveform_format='text', chunk_size=65536):
+    """
+    리포트 요소와 (record_path가 있으면) 파형을 한 번에 XML 파일로 저장
+    리포트 마지막에 빈 <data /> 자리를 만들어 앞뒤 문자열로 나눈 뒤 그 사이에 파형을 구간별로 바로 저장
+    파형을 읽다 실패하면 임시 파일(과 쓰다 만 NPY 파일)을 지우고 기존 XML은 그대로 둠
+    """
+    if record_path is not None:
+        header = wfdb.rdheader(record_path)
+        placeholder = ET.SubElement(root, 'data')
+        head, tail = ET.tostring(root, encoding='unicode').rsplit('<data />', 1)
+        root.remove(placeholder)
+    else:
+        head, tail = ET.tostring(root, encoding='unicode'), ''
+
+    tmp_path = xml_file_path + '.tmp'
+    npy_path = os.path.splitext(xml_file_path)[0] + '.npy'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            out.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            out.write(head)
+            if record_path is not None:
+                if waveform_format == 'npy':
+                    write_npy_waveform(out, record_path, header, chunk_size, npy_path)
+                elif waveform_format == 'base64':
+                    write_base64_waveform(out, record_path, header, chunk_size)
+                else:
+                    write_text_waveform(out, record_path, header, chunk_size)
+            out.write(tail)
+        os.replace(tmp_path, xml_file_path)
+    except Exception:
+        if record_path is not None and waveform_format == 'npy' and os.path.exists(npy_path):
+            os.remove(npy_path)
+        raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def process_holter_records(pdf_dir, xml_dir, waveform_format='text', chunk_size=65536, num_workers=1):
+    """
+    PDF 리포트와 같은 이름의 wfdb 레코드(.hea)를 한 번에 하나의 XML로 저장
+    (process_pdf_files 후 add_record_data_to_xml로 XML을 다시 읽어 추가하는 두 단계를 한 번에 처리)
+    """
+    pdf_files = [f for f in os.listdir(pdf_dir) if f.endswith('.pdf')]
+    tasks = []
+    for filename in pdf_files:
+        record_path = os.path.join(pdf_dir, os.path.splitext(filename)[0])
+        if not os.path.exists(record_path + '.hea'):
+            print(f"Warning: {record_path}.hea does not exist.")
+            record_path = None
+
+        xml_file_path = os.path.join(xml_dir, os.path.splitext(filename)[0] + '.xml')
+        tasks.append((os.path.join(pdf_dir, filename), xml_file_path, record_path, waveform_format, chunk_size))
+    return run_holter_batch(tasks, num_workers, "Processing Holter Records")
 
 def main():
     pdf_dir = 'C:\\Users\\SNUH\\Desktop\\export'
     xml_dir = os.path.join(pdf_dir, 'xml')
+    # 파형 저장 형식: 'text', 'base64', 'npy'
+    waveform_format = 'text'
+    num_workers = os.cpu_count() or 1  # 1이면 순차 처리
 
     if not os.path.exists(xml_dir):
         os.makedirs(xml_dir)
 
-    print("Starting to process PDF files...")
-    process_pdf_files(pdf_dir, xml_dir)
-    print("Starting to add record data to XML...")
-    add_record_data_to_xml(pdf_dir, xml_dir)
+    # 리포트와 파형을 한 번에 저장 (기존 XML에 파형만 추가할 때는 add_record_data_to_xml 사용)
+    print("Starting to process PDF files and record data...")
+    results = process_holter_records(pdf_dir, xml_dir, waveform_format, num_workers=num_workers)
+
+    # 실패한 파일 목록 저장
+    failures = [result for result in results if 'error' in result]
+    if failures:
+        failures_path = os.path.join(xml_dir, 'failures.json')
+        with open(failures_path, 'w', encoding='utf-8') as f:
+            json.dump(failures, f, ensure_ascii=False, indent=2)
+        print(f"Failure list saved: {failures_path}")
 
     print("Completed processing all files.")
 
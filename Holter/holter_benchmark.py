@@ -0,0 +1,86 @@
+import os
+import tempfile
+import time
+import wfdb
+import numpy as np
+import pandas as pd
+from xml.dom.minidom import parseString
+import xml.etree.ElementTree as ET
+
+from Holter_xml import write_holter_xml
+
+def make_synthetic_record(write_dir, record_name='holter', hours=24, fs=200, n_leads=3, seed=0):
+    """Holter와 비슷한 길이의 가상 wfdb 레코드 (format 16, int16 디지털 값) 생성"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(hours * 3600 * fs)) / fs
+    signals = np.empty((len(t), n_leads), dtype=np.int16)
+    for lead in range(n_leads):
+        ecg = 200 * np.sin(2 * np.pi * 1.2 * t + lead) + rng.normal(0, 20, len(t))
+        signals[:, lead] = ecg.astype(np.int16)
+
+    wfdb.wrsamp(record_name, fs=fs, units=['mV'] * n_leads, sig_name=[f'CH{i + 1}' for i in range(n_leads)],
+                d_signal=signals, fmt=['16'] * n_leads, adc_gain=[200.0] * n_leads, baseline=[0] * n_leads,
+                write_dir=write_dir)
+    return os.path.join(write_dir, record_name)
+
+def make_report_root():
+    """process_pdf_files 결과와 비슷한 크기의 리포트 요소"""
+    root = ET.Element('HolterReport')
+    patient_info = ET.SubElement(root, 'PatientInfo')
+    for tag, text in (('PID', '12345678'), ('HookupDate', '01-Jan-2024'), ('HookupTime', '09:00:00'),
+                      ('Duration', '24:00:00')):
+        ET.SubElement(patient_info, tag).text = text
+    general = ET.SubElement(root, 'General')
+    for tag, text in (('QRScomplexes', '101234'), ('VentricularBeats', '12'),
+                      ('SupraventricularBeats', '34'), ('NoisePercentage', '< 1')):
+        ET.SubElement(general, tag).text = text
+    ET.indent(root, space="   ")
+    return root
+
+def write_xml_legacy(root, record_path, xml_file_path):
+    """기존 minidom pretty-print + 전체 p_signal 문자열 변환 + XML 재파싱 방식 (비교용)"""
+    pretty_xml_str = parseString(ET.tostring(root, 'utf-8')).toprettyxml(indent="   ")
+    with open(xml_file_path, "w") as xml_file:
+        xml_file.write(pretty_xml_str)
+
+    record = wfdb.rdrecord(record_path)
+    df = pd.DataFrame(record.p_signal, columns=record.sig_name)
+    data_element = ET.Element('data')
+    for channel, values in enumerate(df.T.values, start=1):
+        ET.SubElement(data_element, 'WaveformData', lead=str(channel)).text = ','.join(map(str, values))
+
+    pretty_xml_str = parseString(ET.tostring(data_element, 'utf-8')).toprettyxml(indent="  ")
+    pretty_xml_str = pretty_xml_str.replace('><WaveformData', '>\n<WaveformData')
+    pretty_xml_str = pretty_xml_str.replace('</WaveformData><', '</WaveformData>\n<')
+
+    tree = ET.parse(xml_file_path)
+    tree.getroot().append(ET.fromstring(pretty_xml_str))
+    tree.write(xml_file_path, encoding='utf-8', xml_declaration=True)
+
+def file_size(xml_file_path):
+    size = os.path.getsize(xml_file_path)
+    npy_path = os.path.splitext(xml_file_path)[0] + '.npy'
+    if os.path.exists(npy_path):
+        size += os.path.getsize(npy_path)
+    return size
+
+def benchmark_holter_xml(hours=24, fs=200, n_leads=3):
+    with tempfile.TemporaryDirectory() as work_dir:
+        record_path = make_synthetic_record(work_dir, hours=hours, fs=fs, n_leads=n_leads)
+        print(f"Record: {hours} h, {fs} Hz, {n_leads} leads ({int(hours * 3600 * fs):,} samples per lead)")
+        print(f"{'method':>14} {'time (s)':>10} {'size (MB)':>10}")
+
+        runs = [('legacy text', lambda path: write_xml_legacy(make_report_root(), record_path, path))]
+        for waveform_format in ('text', 'base64', 'npy'):
+            runs.append((waveform_format, lambda path, fmt=waveform_format:
+                         write_holter_xml(make_report_root(), path, record_path, fmt)))
+
+        for name, run in runs:
+            xml_file_path = os.path.join(work_dir, f"{name.replace(' ', '_')}.xml")
+            start = time.perf_counter()
+            run(xml_file_path)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>14} {elapsed:>10.1f} {file_size(xml_file_path) / 1024 ** 2:>10.1f}")
+
+if __name__ == "__main__":
+    benchmark_holter_xml()
@@ -0,0 +1,195 @@
+import re
+import random
+import xml.etree.ElementTree as ET
+from xml.etree.ElementTree import Element, SubElement
+
+from Holter_xml import build_report_xml, scan_report_text
+
+SAMPLE_REPORT = """HOLTER REPORT
+John
+Patient Name:
+12345
+ID:
+Medications:
+01-Jan-2024
+Hookup Date:
+08:00:00
+Hookup Time:
+23:59:00
+Duration:
+General
+100000 QRS complexes
+12 Ventricular beats
+34 Supraventricular beats
+< 1 % of total time classified as noise
+Heart Rates
+55 Minimum at 03:00:00 02-Jan
+72 Average
+140 Maximum at 10:00:00 01-Jan
+100 Beats in tachycardia (>=100 bpm), 1% total
+200 Beats in bradycardia (<=60 bpm), 2% total
+1.52 Seconds Max R-R at 04:00:00 02-Jan
+Ventriculars (V, F, E, I)
+10 Isolated
+1 Couplets
+0 Bigeminal cycles
+0 Runs totaling 0 beats
+3 Beats longest run 150 bpm 06:00:00 02-Jan
+4 Beats fastest run 160 bpm 07:00:00 02-Jan
+Supraventriculars (S, J, A)
+30 Isolated
+2 Couplets
+1 Bigeminal cycles
+1 Runs totaling 5 beats
+5 Beats longest run 120 bpm 05:00:00 02-Jan
+5 Beats fastest run 130 bpm 05:00:00 02-Jan
+Interpretation
+Sinus rhythm
+"""
+
+# 구간 표시만 있는 줄 (구간 순서가 바뀌거나 중간에 끼어든 리포트)
+SECTION_LINES = ['General', 'Heart Rates', 'Ventriculars (V, F, E, I)', 'Supraventriculars (S, J, A)',
+                 'Interpretation']
+
+# 기존 parse_holter_report의 구간 / 필드 정규식 (비교 기준)
+LEGACY_PATIENT_PATTERNS = [
+    (re.compile(r"Patient Name:\n(\d+)\nID:"), 'PID', 'Patient ID'),
+    (re.compile(r"Medications:\n(\d+-\w+-\d+)\nHookup Date:"), 'HookupDate', 'Hookup date'),
+    (re.compile(r"Hookup Date:\n(\d+:\d+:\d+)\nHookup Time:"), 'HookupTime', 'Hookup time'),
+    (re.compile(r"Hookup Time:\n(\d+:\d+:\d+)\nDuration:"), 'Duration', 'Duration'),
+]
+LEGACY_GENERAL_SECTION_PATTERN = re.compile(r"General\n(.+?)Heart Rates", re.DOTALL)
+LEGACY_GENERAL_PATTERNS = [
+    (re.compile(r"(\d+) QRS complexes"), 'QRScomplexes', 'QRS complexes'),
+    (re.compile(r"(\d+) Ventricular beats"), 'VentricularBeats', 'Ventricular beats'),
+    (re.compile(r"(\d+) Supraventricular beats"), 'SupraventricularBeats', 'Supraventricular beats'),
+]
+LEGACY_NOISE_PERCENTAGE_PATTERN = re.compile(r"(<\s*\d+|\d+) % of total time classified as noise")
+LEGACY_HEART_RATE_PATTERNS = [
+    (re.compile(r"(\d+) Minimum at ([\d:]+ \d+-\w+)"), 'MinimumRate', 'Timestamp'),
+    (re.compile(r"(\d+) Average"), 'AverageRate', None),
+    (re.compile(r"(\d+) Maximum at ([\d:]+ \d+-\w+)"), 'MaximumRate', 'Timestamp'),
+    (re.compile(r"(\d+) Beats in tachycardia \(>=?100 bpm\), (\d+)% total"), 'TachycardiaBeats', 'TachycardiaPercentage'),
+    (re.compile(r"(\d+) Beats in bradycardia \(<=?60 bpm\), (\d+)% total"), 'BradycardiaBeats', 'BradycardiaPercentage'),
+]
+LEGACY_MAX_RR_PATTERN = re.compile(r"(\d+\.\d+) Seconds Max R-R at ([\d:]+ \d+-\w+)")
+LEGACY_ECTOPIC_SECTIONS = [
+    ('Ventriculars', re.compile(r"Ventriculars \(V, F, E, I\)\n([\s\S]+?)\nSupraventriculars \(S, J, A\)")),
+    ('Supraventriculars', re.compile(r"Supraventriculars \(S, J, A\)\n([\s\S]+?)Interpretation")),
+]
+LEGACY_ECTOPIC_PATTERNS = [
+    (re.compile(r"(\d+) Isolated"), ['Isolated']),
+    (re.compile(r"(\d+) Couplets"), ['Couplets']),
+    (re.compile(r"(\d+) Bigeminal cycles"), ['BigeminalCycles']),
+    (re.compile(r"(\d+) Runs totaling (\d+) beats"), ['Runs', ('RunsDetails', 'TotalBeats')]),
+    (re.compile(r"(\d+) Beats longest run (\d+) bpm ([\d:]+ \d+-\w+)"), [('LongestRun', 'Beats'), ('LongestRun', 'BPM'), ('LongestRun', 'Timestamp')]),
+    (re.compile(r"(\d+) Beats fastest run (\d+) bpm ([\d:]+ \d+-\w+)"), [('FastestRun', 'Beats'), ('FastestRun', 'BPM'), ('FastestRun', 'Timestamp')]),
+]
+
+def search_required(pattern, text, field):
+    match = pattern.search(text)
+    if match is None:
+        raise ValueError(f"{field} not found in report text")
+    return match
+
+def parse_report_legacy(text):
+    """기존 parse_holter_report의 파싱 부분 (항목별 search, 구간은 시작 / 끝 표시 쌍으로 잘라냄)"""
+    root = Element('HolterReport')
+    patient_values = [search_required(pattern, text, field).group(1)
+                      for pattern, tag, field in LEGACY_PATIENT_PATTERNS]
+
+    general_section = search_required(LEGACY_GENERAL_SECTION_PATTERN, text, 'General section').group(1)
+    general_values = [search_required(pattern, general_section, field).group(1)
+                      for pattern, tag, field in LEGACY_GENERAL_PATTERNS]
+    noise_percentage_match = LEGACY_NOISE_PERCENTAGE_PATTERN.search(general_section)
+    noise_percentage = noise_percentage_match.group(1) if noise_percentage_match else "0"
+
+    patient_info = SubElement(root, 'PatientInfo')
+    for (pattern, tag, field), value in zip(LEGACY_PATIENT_PATTERNS, patient_values):
+        SubElement(patient_info, tag).text = value
+
+    general = SubElement(root, 'General')
+    for (pattern, tag, field), value in zip(LEGACY_GENERAL_PATTERNS, general_values):
+        SubElement(general, tag).text = value
+    SubElement(general, 'NoisePercentage').text = noise_percentage
+
+    heart_rates = SubElement(root, 'HeartRates')
+    for pattern, main_tag, sub_tag in LEGACY_HEART_RATE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            if sub_tag:
+                element = SubElement(heart_rates, main_tag)
+                SubElement(element, sub_tag).text = match.group(2)
+                element.text = match.group(1)
+            else:
+                SubElement(heart_rates, main_tag).text = match.group(1)
+    max_rr_match = LEGACY_MAX_RR_PATTERN.search(text)
+    if max_rr_match:
+        max_rr = SubElement(heart_rates, 'SecondsMaxRR')
+        SubElement(max_rr, 'Seconds').text = max_rr_match.group(1)
+        SubElement(max_rr, 'Timestamp').text = max_rr_match.group(2)
+
+    for name, section_pattern in LEGACY_ECTOPIC_SECTIONS:
+        section_match = section_pattern.search(text)
+        section = section_match.group(1) if section_match else ""
+        section_xml = SubElement(root, name)
+        for pattern, tags in LEGACY_ECTOPIC_PATTERNS:
+            match = pattern.search(section)
+            if match:
+                for tag_index, tag in enumerate(tags):
+                    if isinstance(tag, tuple):
+                        parent_tag = SubElement(section_xml, tag[0])
+                        SubElement(parent_tag, tag[1]).text = match.group(tag_index + 1)
+                    else:
+                        SubElement(section_xml, tag).text = match.group(tag_index + 1)
+    return root
+
+def parse_result(parse, text):
+    """XML 문자열 또는 예외 이름"""
+    try:
+        return ET.tostring(parse(text), encoding='unicode')
+    except ValueError as e:
+        return type(e).__name__
+
+def make_report_variant(rng, text=SAMPLE_REPORT):
+    """줄 삭제 / 복사 / 순서 바꿈 / 줄 합치기 / 구간 표시 끼워 넣기 / 숫자 변경을 임의로 섞은 리포트"""
+    lines = text.split('\n')
+    for _ in range(rng.randint(1, 4)):
+        op = rng.choice(['drop', 'copy', 'swap', 'join', 'marker', 'marker', 'digits'])
+        pos = rng.randrange(len(lines))
+        if op == 'drop' and len(lines) > 1:
+            del lines[pos]
+        elif op == 'copy':
+            lines.insert(rng.randrange(len(lines) + 1), lines[pos])
+        elif op == 'swap' and pos + 1 < len(lines):
+            lines[pos], lines[pos + 1] = lines[pos + 1], lines[pos]
+        elif op == 'join' and pos + 1 < len(lines):
+            lines[pos:pos + 2] = [lines[pos] + rng.choice(['', ' ']) + lines[pos + 1]]
+        elif op == 'marker':
+            lines.insert(pos, rng.choice(SECTION_LINES))
+        elif op == 'digits':
+            lines[pos] = re.sub(r"\d+", lambda m: str(rng.randrange(1000)), lines[pos])
+    return '\n'.join(lines)
+
+def compare_report_parsers(n_variants=3000, seed=0, show=5):
+    """기존 파서와 scan_report_text + build_report_xml 결과를 임의 리포트로 비교, 다른 리포트 수 반환"""
+    rng = random.Random(seed)
+    texts = [SAMPLE_REPORT] + [make_report_variant(rng) for _ in range(n_variants)]
+    new_parse = lambda text: build_report_xml(scan_report_text(text))
+
+    mismatches = []
+    n_errors = 0
+    for text in texts:
+        expected = parse_result(parse_report_legacy, text)
+        result = parse_result(new_parse, text)
+        n_errors += expected == 'ValueError'
+        if result != expected:
+            mismatches.append((text, expected, result))
+
+    print(f"{len(texts)} reports, {n_errors} raise ValueError in the legacy parser, {len(mismatches)} differ")
+    for text, expected, result in mismatches[:show]:
+        print(f"\n--- report\n{text}\n--- legacy\n{expected}\n--- new\n{result}")
+    return len(mismatches)
+
+if __name__ == "__main__":
+    compare_report_parsers()